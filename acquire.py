@@ -1,71 +1,862 @@
 # imports
 import pandas as pd
+import numpy as np
 import os
-from env import get_db_url
+import json
+import time
+import hashlib
+import tempfile
+import threading
+import importlib.util
+from contextlib import contextmanager
+from collections import OrderedDict
+import instrument
 
-# functions
-def get_titanic_data():
+# cache settings
+# 'parquet' and 'feather' need pyarrow; without it the loaders fall back to 'csv'
+CACHE_FORMAT = 'parquet'
+CACHE_EXTENSIONS = {'parquet': '.parquet', 'feather': '.feather', 'csv': '.csv'}
+# shared by every worker on the node; override with the ACQUIRE_CACHE_DIR environment variable
+CACHE_DIR = os.environ.get('ACQUIRE_CACHE_DIR', 'data_cache')
+# seconds before a cache entry expires, None keeps entries until they are invalidated
+CACHE_TTL = None
+# seconds after which a rebuild lock left behind by a killed worker is ignored
+LOCK_TIMEOUT = 600
+# rows per chunk yielded by stream_data
+CHUNK_SIZE = 50_000
+# bytes of loaded frames get_data keeps in memory (least recently used evicted first), 0 disables
+MEMO_BUDGET = 512 * 2**20
+
+# database name -> connection url overrides, e.g. {'telco_churn': 'sqlite:///telco.db'} to run
+# against a local stand-in instead of the urls built by env.get_db_url
+DB_URLS = {}
+# (process id, url) -> pooled engine, see get_engine
+_ENGINES = {}
+_ENGINES_LOCK = threading.Lock()
+# memo key -> (frame, bytes), most recently used last, see memo_get / memo_put
+_MEMO = OrderedDict()
+_MEMO_LOCK = threading.Lock()
+_MEMO_STATS = {'hits': 0, 'misses': 0, 'evictions': 0, 'bytes': 0}
+
+# registered datasets: name -> sql query, database name and the tables the query reads
+DATASETS = {
+    'titanic': {
+        'query': 'select * from passengers',
+        'db': 'titanic_db',
+        'tables': ['passengers'],
+    },
+    'iris': {
+        'query': 'select * from species join measurements using (species_id)',
+        'db': 'iris_db',
+        'tables': ['species', 'measurements'],
+    },
+    'telco': {
+        'query': 'select * from customers join contract_types using(contract_type_id) join internet_service_types using(internet_service_type_id) join payment_types using(payment_type_id)',
+        'db': 'telco_churn',
+        'tables': ['customers', 'contract_types', 'internet_service_types', 'payment_types'],
+    },
+}
+
+# projection and filter helpers
+# filters are (column, op, value) tuples that must all hold; op is one of FILTER_OPS, and value is
+# ignored for 'is null' / 'not null', e.g. [('age', 'not null', None), ('fare', '>', 0)]
+FILTER_OPS = ['==', '!=', '<', '<=', '>', '>=', 'in', 'not in', 'is null', 'not null']
+
+def _bind_value(value):
+    # filter values often come straight from a dataframe: numpy scalars become plain Python values
+    if isinstance(value, (list, tuple, set, np.ndarray, pd.Index, pd.Series)):
+        return [_bind_value(v) for v in value]
+    return value.item() if isinstance(value, np.generic) else value
+
+def build_query(name, columns=None, filters=None):
     """
-    This function checks if a CSV file exists, reads it if it does, and if not, reads data from a SQL
-    database, saves it to a CSV file, and returns the data.
-    :return: The function `get_titanic_data()` returns a pandas DataFrame containing the Titanic
-    passenger data. If the data has been previously cached as a CSV file, it reads the data from the
-    file. Otherwise, it reads the data from a SQL database, caches it as a CSV file, and returns the
-    DataFrame.
-    """
-    filename = "titanic.csv"
-    if os.path.isfile(filename):
-        print('csv file found and loaded')
-        return pd.read_csv(filename)
-    else:
-        print('creating df and exporting csv')
-        # read the SQL query into a dataframe
-        df = pd.read_sql('select * from passengers', get_db_url('titanic_db'))
-        # Write that dataframe to disk for later. Called "caching" the data for later.
-        df.to_csv(filename, index=False)
-        # Return the dataframe to the calling code
+    This function pushes a column projection and row filters down into a dataset's SQL query. The
+    filter values are not spliced into the SQL: each one gets a named parameter (:f0, :f1, ...),
+    bound when the query runs, see `bind_query`.
+
+    :param name: the name of a dataset registered in DATASETS
+    :param columns: a list of column names to select, defaults to every column (optional)
+    :param filters: a list of (column, op, value) filters, see FILTER_OPS (optional)
+    :return: the SQL query text and a dict of parameter name -> value ('in' values are lists).
+    """
+    query = DATASETS[name]['query']
+    if columns is not None:
+        query = query.replace('select *', 'select ' + ', '.join(columns), 1)
+    params = {}
+    if filters:
+        conditions = []
+        for column, op, value in filters:
+            if op not in FILTER_OPS:
+                raise ValueError(f'unknown filter op {op!r}, expected one of {FILTER_OPS}')
+            if op in ('is null', 'not null'):
+                conditions.append(f"{column} {'is null' if op == 'is null' else 'is not null'}")
+            else:
+                name = f'f{len(params)}'
+                params[name] = _bind_value(value)
+                conditions.append(f"{column} {'=' if op == '==' else op} :{name}")
+        query += ' where ' + ' and '.join(conditions)
+    return query, params
+
+def query_key(query, params):
+    """
+    This function gives the text that identifies a parameterized query in the cache, so the same
+    query with other filter values gets its own entry.
+
+    :param query: the SQL query text from `build_query`
+    :param params: the parameters from `build_query`
+    :return: the query text, followed by the parameters as JSON when there are any.
+    """
+    return query if not params else f'{query} -- {json.dumps(params, sort_keys=True, default=str)}'
+
+def bind_query(query, params=None):
+    """
+    This function binds the filter values of a query from `build_query` for execution.
+
+    :param query: the SQL query text
+    :param params: the parameters from `build_query` (optional)
+    :return: a sqlalchemy TextClause to pass to `pd.read_sql`.
+    """
+    from sqlalchemy import bindparam, text
+    return text(query).bindparams(*(bindparam(name, value, expanding=isinstance(value, list))
+                                    for name, value in (params or {}).items()))
+
+def apply_filters(df, filters=None):
+    """
+    This function applies (column, op, value) row filters to a dataframe.
+
+    :param df: a pandas DataFrame
+    :param filters: a list of (column, op, value) filters, see FILTER_OPS (optional)
+    :return: the rows of df that pass every filter.
+    """
+    if not filters:
         return df
+    mask = pd.Series(True, index=df.index)
+    for column, op, value in filters:
+        s = df[column]
+        if op == 'is null':
+            mask &= s.isna()
+        elif op == 'not null':
+            mask &= s.notna()
+        elif op in ('in', 'not in'):
+            mask &= s.isin(list(value)) == (op == 'in')
+        else:
+            mask &= {'==': s.eq, '!=': s.ne, '<': s.lt, '<=': s.le, '>': s.gt, '>=': s.ge}[op](value)
+    return df[mask]
+
+def _arrow_filter(filters):
+    import pyarrow.compute as pc
+    expression = None
+    for column, op, value in filters:
+        field = pc.field(column)
+        if op == 'is null':
+            condition = field.is_null()
+        elif op == 'not null':
+            condition = field.is_valid()
+        elif op in ('in', 'not in'):
+            condition = field.isin(list(value))
+            condition = ~condition if op == 'not in' else condition
+        else:
+            condition = {'==': field.__eq__, '!=': field.__ne__, '<': field.__lt__,
+                         '<=': field.__le__, '>': field.__gt__, '>=': field.__ge__}[op](value)
+        expression = condition if expression is None else expression & condition
+    return expression
+
+def _filter_columns(columns, filters):
+    if columns is None or not filters:
+        return columns
+    return list(columns) + [f[0] for f in filters if f[0] not in columns]
 
-def get_iris_data():
+# database helpers
+def db_url(db):
     """
-    This function checks if a CSV file exists, and if it does, it returns the data from the file,
-    otherwise it reads data from a SQL database, saves it to a CSV file, and returns the data.
-    :return: The function `get_iris_data()` returns a pandas DataFrame containing the iris data. If the
-    data is already cached in a CSV file named "iris.csv", it reads the data from the file. Otherwise,
-    it reads the data from a SQL database named "iris_db", joins the "species" and "measurements"
-    tables, caches the data in a CSV file, and returns the DataFrame.
+    This function returns the connection url for a database, using an override from DB_URLS when
+    there is one and `env.get_db_url` otherwise.
+
+    :param db: the name of the database
+    :return: a SQLAlchemy connection url string.
+    """
+    if DB_URLS.get(db):
+        return DB_URLS[db]
+    # env.py holds the credentials and is not committed, so it is only imported once a url is needed
+    try:
+        from env import get_db_url
+    except ImportError as e:
+        raise ImportError(f'no url for {db}: add env.py with get_db_url or set acquire.DB_URLS') from e
+    return get_db_url(db)
+
+def get_engine(db):
+    """
+    This function returns a pooled SQLAlchemy engine for a database. Engines are created once per
+    process and reused, so repeated loads skip the cold connection set-up.
+
+    :param db: the name of the database
+    :return: a SQLAlchemy Engine.
+    """
+    key = (os.getpid(), db_url(db))
+    with _ENGINES_LOCK:
+        if key not in _ENGINES:
+            from sqlalchemy import create_engine
+            _ENGINES[key] = create_engine(key[1], pool_pre_ping=True)
+        return _ENGINES[key]
+
+def dispose_engines():
+    """
+    This function closes every pooled connection opened by `get_engine`.
+    """
+    with _ENGINES_LOCK:
+        for engine in _ENGINES.values():
+            engine.dispose()
+        _ENGINES.clear()
+
+# cache helpers
+def resolve_format(fmt=None):
+    """
+    This function picks the cache format to use, falling back to CSV when the columnar formats are
+    requested but pyarrow is not installed.
+
+    :param fmt: 'parquet', 'feather' or 'csv'; defaults to the module level CACHE_FORMAT (optional)
+    :return: the name of the cache format that will actually be used.
     """
-    filename = "iris.csv"
-    if os.path.isfile(filename):
-        print('csv file found and loaded')
-        return pd.read_csv(filename)
+    fmt = fmt or CACHE_FORMAT
+    if fmt not in CACHE_EXTENSIONS:
+        raise ValueError(f'unknown cache format {fmt!r}, expected one of {list(CACHE_EXTENSIONS)}')
+    if fmt != 'csv' and importlib.util.find_spec('pyarrow') is None:
+        instrument.message(f'pyarrow not installed, using csv instead of {fmt}')
+        return 'csv'
+    return fmt
+
+def read_cache(filename, fmt, columns=None, filters=None):
+    """
+    This function reads a cached dataset, loading only the requested columns and rows. Parquet and
+    Feather files are memory-mapped, so unused columns are never read from disk, and Parquet skips
+    row groups that the filters rule out.
+
+    :param filename: path of the cached file
+    :param fmt: the format of the cached file, 'parquet', 'feather' or 'csv'
+    :param columns: a list of column names to load, defaults to every column (optional)
+    :param filters: a list of (column, op, value) filters, see FILTER_OPS (optional)
+    :return: a pandas DataFrame with the cached data.
+    """
+    if fmt == 'parquet':
+        return pd.read_parquet(filename, engine='pyarrow', columns=columns, memory_map=True,
+                               filters=_arrow_filter(filters) if filters else None)
+    if fmt == 'feather':
+        from pyarrow import feather
+        table = feather.read_table(filename, columns=_filter_columns(columns, filters), memory_map=True)
+        if filters:
+            table = table.filter(_arrow_filter(filters))
+        df = table.to_pandas()
     else:
-        print('creating df and exporting csv')
-        # read the SQL query into a dataframe
-        df = pd.read_sql('select * from species join measurements using (species_id)', get_db_url('iris_db'))
-        # Write that dataframe to disk for later. Called "caching" the data for later.
-        df.to_csv(filename, index=False)
-        # Return the dataframe to the calling code
-        return df
+        df = pd.read_csv(filename, usecols=_filter_columns(columns, filters))
+    return select_frame(df, columns, filters)
 
-def get_telco_data():
+def write_cache(df, filename, fmt):
     """
-    This function reads telco data from a CSV file if it exists, otherwise it reads the data from a SQL
-    database and saves it to the CSV file for future use.
-    :return: The function `get_telco_data()` returns a pandas DataFrame containing data from either a
-    CSV file named "telco.csv" or a SQL query from a database named "telco_churn". If the CSV file
-    exists, it reads the data from the file, otherwise it reads the data from the SQL query, saves it to
-    the CSV file for caching, and returns the DataFrame.
+    This function writes a dataframe to the cache in the given format. The columnar formats keep the
+    dtypes of the dataframe, so nothing has to be re-parsed or re-guessed on the next load.
+
+    :param df: the pandas DataFrame to cache
+    :param filename: path of the cache file to write
+    :param fmt: the format to write, 'parquet', 'feather' or 'csv'
     """
-    filename = "telco.csv"
-    if os.path.isfile(filename):
-        print('csv file found and loaded')
-        return pd.read_csv(filename)
+    if fmt == 'parquet':
+        df.to_parquet(filename, engine='pyarrow', index=False)
+    elif fmt == 'feather':
+        df.reset_index(drop=True).to_feather(filename)
     else:
-        print('creating df and exporting csv')
-        # read the SQL query into a dataframe
-        df = pd.read_sql('select * from customers join contract_types using(contract_type_id) join internet_service_types using(internet_service_type_id) join payment_types using(payment_type_id)', get_db_url('telco_churn'))
-        # Write that dataframe to disk for later. Called "caching" the data for later.
         df.to_csv(filename, index=False)
-        # Return the dataframe to the calling code
+
+def _digest(*parts):
+    return hashlib.sha256(json.dumps(parts).encode()).hexdigest()[:16]
+
+def cache_key(query, db, schema=''):
+    """
+    This function builds the key of a cache entry from the query text, the database name and the
+    schema fingerprint of the tables the query reads.
+
+    :param query: the SQL query text
+    :param db: the name of the database the query runs against
+    :param schema: the fingerprint returned by `schema_fingerprint`, '' when unknown (optional)
+    :return: a string "<query digest>-<schema digest>"; entries for the same query share the prefix.
+    """
+    return f'{_digest(db, query)}-{_digest(schema)}'
+
+def schema_fingerprint(db, tables):
+    """
+    This function fingerprints the column names and types of the given tables, so a cache entry is
+    rebuilt when the upstream schema changes.
+
+    :param db: the name of the database
+    :param tables: a list of the table names to fingerprint
+    :return: a hex digest of the tables' column definitions.
+    """
+    from sqlalchemy import inspect
+    inspector = inspect(get_engine(db))
+    columns = [[table, [[c['name'], str(c['type'])] for c in inspector.get_columns(table)]]
+               for table in sorted(tables)]
+    return _digest(columns)
+
+def _manifest_path(name, key):
+    return os.path.join(CACHE_DIR, f'{name}-{key}.json')
+
+def _atomic_write(path, write):
+    """
+    Calls write(tmp_path) on a temp file in the same directory, then renames it over path, so
+    readers never see a partially written file.
+    """
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or '.', prefix='.tmp-')
+    os.close(fd)
+    try:
+        write(tmp)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+def _valid_manifest(manifest_file, ttl):
+    try:
+        with open(manifest_file) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    path = manifest.get('path', '')
+    if not os.path.isfile(path) or os.path.getsize(path) != manifest.get('size'):
+        return None
+    if ttl is not None and time.time() - manifest['created'] > ttl:
+        return None
+    return manifest
+
+def find_cache_entry(name, query, db, schema=None, ttl=None):
+    """
+    This function looks up a complete, unexpired cache entry for a query.
+
+    :param name: the name of the dataset
+    :param query: the SQL query text
+    :param db: the name of the database
+    :param schema: the schema fingerprint to match; None accepts the newest entry for the query (optional)
+    :param ttl: maximum age of the entry in seconds, defaults to CACHE_TTL (optional)
+    :return: the manifest dict of the entry (its 'path' and 'format' locate the data), or None.
+    """
+    ttl = CACHE_TTL if ttl is None else ttl
+    if schema is not None:
+        return _valid_manifest(_manifest_path(name, cache_key(query, db, schema)), ttl)
+    if not os.path.isdir(CACHE_DIR):
+        return None
+    prefix = f'{name}-{_digest(db, query)}-'
+    candidates = [_valid_manifest(os.path.join(CACHE_DIR, f), ttl)
+                  for f in os.listdir(CACHE_DIR) if f.startswith(prefix) and f.endswith('.json')]
+    candidates = [m for m in candidates if m is not None]
+    return max(candidates, key=lambda m: m['created']) if candidates else None
+
+def store_cache_entry(df, name, query, db, schema, fmt):
+    """
+    This function writes a dataframe to the cache. The data file is written first and the manifest
+    last, each through an atomic rename, so an entry only becomes visible once it is complete.
+    Older entries for the same query (e.g. from before a schema change) are removed.
+
+    :param df: the pandas DataFrame to cache
+    :param name: the name of the dataset
+    :param query: the SQL query text
+    :param db: the name of the database
+    :param schema: the schema fingerprint of the query's tables
+    :param fmt: the cache format, 'parquet', 'feather' or 'csv'
+    :return: the manifest dict of the new entry.
+    """
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    path = _entry_path(name, cache_key(query, db, schema), fmt)
+    _atomic_write(path, lambda tmp: write_cache(df, tmp, fmt))
+    return _commit_entry(name, query, db, schema, fmt, path, len(df), list(df.columns))
+
+def _entry_path(name, key, fmt):
+    return os.path.join(CACHE_DIR, f'{name}-{key}{CACHE_EXTENSIONS[fmt]}')
+
+def _commit_entry(name, query, db, schema, fmt, path, rows, columns):
+    """
+    Publishes a fully written data file by atomically writing its manifest, then removes older
+    entries for the same query.
+    """
+    key = cache_key(query, db, schema)
+    manifest = {'name': name, 'db': db, 'query': query, 'schema': schema, 'format': fmt,
+                'path': path, 'size': os.path.getsize(path), 'created': time.time(),
+                'rows': rows, 'columns': columns}
+    def write_manifest(tmp):
+        with open(tmp, 'w') as f:
+            json.dump(manifest, f)
+    manifest_file = _manifest_path(name, key)
+    _atomic_write(manifest_file, write_manifest)
+    prefix = f'{name}-{_digest(db, query)}-'
+    for f in os.listdir(CACHE_DIR):
+        stale = os.path.join(CACHE_DIR, f)
+        if f.startswith(prefix) and f.endswith('.json') and stale != manifest_file:
+            invalidate_entry(stale)
+    return manifest
+
+def invalidate_entry(manifest_file):
+    """
+    This function removes one cache entry, manifest first so no reader picks up a half-deleted entry.
+
+    :param manifest_file: path of the entry's manifest
+    """
+    try:
+        with open(manifest_file) as f:
+            path = json.load(f).get('path')
+    except (OSError, ValueError):
+        path = None
+    for f in [manifest_file, path]:
+        if f and os.path.exists(f):
+            os.remove(f)
+
+def invalidate_cache(name=None):
+    """
+    This function explicitly invalidates cached datasets, forcing the next load to query the database.
+
+    :param name: the dataset to invalidate, defaults to every dataset (optional)
+    """
+    if not os.path.isdir(CACHE_DIR):
+        return
+    for f in os.listdir(CACHE_DIR):
+        if f.endswith('.json') and (name is None or f.startswith(f'{name}-')):
+            invalidate_entry(os.path.join(CACHE_DIR, f))
+
+@contextmanager
+def cache_lock(name, timeout=None):
+    """
+    This context manager holds a per-dataset lock file while a cache entry is rebuilt, so concurrent
+    workers wait for one rebuild instead of racing to run the same query. Locks older than
+    LOCK_TIMEOUT seconds are treated as left behind by a killed worker and broken.
+
+    :param name: the name of the dataset being rebuilt
+    :param timeout: seconds before a lock is considered stale, defaults to LOCK_TIMEOUT (optional)
+    """
+    timeout = LOCK_TIMEOUT if timeout is None else timeout
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    lock = os.path.join(CACHE_DIR, f'{name}.lock')
+    while True:
+        try:
+            os.close(os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            break
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(lock) > timeout:
+                    os.remove(lock)
+                    continue
+            except FileNotFoundError:
+                continue
+            time.sleep(0.1)
+    try:
+        yield
+    finally:
+        if os.path.exists(lock):
+            os.remove(lock)
+
+def migrate_legacy_cache(name, fmt=None, remove=False):
+    """
+    This function moves an old "<name>.csv" (or "<name>.parquet"/"<name>.feather") cache from the
+    working directory into the cache layer. Its schema is unknown, so it is only used when schema
+    checking is off.
+
+    :param name: the name of the dataset, e.g. 'titanic', 'iris' or 'telco'
+    :param fmt: the format to migrate to, defaults to CACHE_FORMAT (optional)
+    :param remove: delete the old file after it has been migrated, defaults to False (optional)
+    :return: the migrated pandas DataFrame, or None if there was no old cache file.
+    """
+    fmt = resolve_format(fmt)
+    for old_fmt, ext in CACHE_EXTENSIONS.items():
+        old_file = name + ext
+        if os.path.isfile(old_file) and (old_fmt == 'csv' or resolve_format(old_fmt) == old_fmt):
+            df = read_cache(old_file, old_fmt)
+            dataset = DATASETS[name]
+            store_cache_entry(df, name, dataset['query'], dataset['db'], '', fmt)
+            instrument.message(f'{old_file} migrated to {fmt} cache')
+            if remove:
+                os.remove(old_file)
+            return df
+    return None
+
+# in-memory memoization
+def _memo_key(entry, columns=None, filters=None):
+    return (entry['path'], entry['created'], tuple(columns) if columns is not None else None,
+            repr(filters) if filters else None)
+
+def _copy_on_write():
+    try:
+        return int(pd.__version__.split('.')[0]) >= 3 or pd.get_option('mode.copy_on_write') is True
+    except (KeyError, ValueError):
+        return False
+
+def _memo_view(df):
+    """
+    Returns a frame that shares nothing mutable with the memoized one: a lazy copy under pandas
+    copy-on-write, a full copy otherwise, so in-place edits by callers never reach the memo.
+    """
+    return df.copy(deep=not _copy_on_write())
+
+def memo_get(key):
+    """
+    This function looks up a loaded frame in the in-memory memo and marks it as recently used.
+
+    :param key: the memo key of a cache entry, see `_memo_key`
+    :return: the memoized pandas DataFrame (do not modify it), or None.
+    """
+    with _MEMO_LOCK:
+        if key in _MEMO:
+            _MEMO.move_to_end(key)
+            _MEMO_STATS['hits'] += 1
+            return _MEMO[key][0]
+        _MEMO_STATS['misses'] += 1
+        return None
+
+def memo_put(key, df):
+    """
+    This function memoizes a loaded frame, evicting the least recently used frames until the memo
+    fits in MEMO_BUDGET bytes. Frames larger than the whole budget are not memoized.
+
+    :param key: the memo key of a cache entry, see `_memo_key`
+    :param df: the pandas DataFrame to memoize
+    :return: True if df was memoized (callers must then not modify it), False otherwise.
+    """
+    size = int(df.memory_usage(index=True, deep=True).sum()) if MEMO_BUDGET else 0
+    with _MEMO_LOCK:
+        if key in _MEMO:
+            _MEMO_STATS['bytes'] -= _MEMO.pop(key)[1]
+        if not MEMO_BUDGET or size > MEMO_BUDGET:
+            return False
+        while _MEMO and _MEMO_STATS['bytes'] + size > MEMO_BUDGET:
+            _MEMO_STATS['bytes'] -= _MEMO.popitem(last=False)[1][1]
+            _MEMO_STATS['evictions'] += 1
+        _MEMO[key] = (df, size)
+        _MEMO_STATS['bytes'] += size
+        return True
+
+def memo_stats():
+    """
+    This function reports how well the in-memory memo is doing.
+
+    :return: a dict with the hits, misses and evictions so far, and the number of entries and bytes
+    currently memoized.
+    """
+    with _MEMO_LOCK:
+        return dict(_MEMO_STATS, entries=len(_MEMO))
+
+def clear_memo():
+    """
+    This function empties the in-memory memo and resets its counters.
+    """
+    with _MEMO_LOCK:
+        _MEMO.clear()
+        _MEMO_STATS.update(hits=0, misses=0, evictions=0, bytes=0)
+
+def get_data(name, columns=None, fmt=None, ttl=None, refresh=False, check_schema=False, filters=None):
+    """
+    This function returns a registered dataset from the cache if there is a complete, unexpired entry
+    for it, and otherwise reads it from the SQL database (or migrates an old cache file), caches it
+    and returns it. When only some columns or rows are requested and the full dataset is not cached,
+    the projection and filters are pushed down into the SQL query and the smaller result is cached.
+    Loaded frames are also memoized in memory (see MEMO_BUDGET), so repeated calls in one process
+    skip the disk read; callers get their own copy of a memoized frame, while frames that are not
+    memoized (over the budget, or MEMO_BUDGET = 0) are returned without copying.
+
+    :param name: the name of a dataset registered in DATASETS
+    :param columns: a list of column names to return, defaults to every column (optional)
+    :param fmt: the cache format, 'parquet', 'feather' or 'csv', defaults to CACHE_FORMAT (optional)
+    :param ttl: maximum age of a cache entry in seconds, defaults to CACHE_TTL (optional)
+    :param refresh: ignore the cache and query the database again, defaults to False (optional)
+    :param check_schema: fingerprint the source tables (one metadata query) and only accept an entry
+    built from the same schema, defaults to False (optional)
+    :param filters: a list of (column, op, value) row filters, see FILTER_OPS (optional)
+    :return: a pandas DataFrame with the requested dataset.
+    """
+    with instrument.stage('get_data', dataset=name) as event:
+        df = _get_data(event, name, columns, fmt, ttl, refresh, check_schema, filters)
+        event['rows'], event['columns'] = df.shape
         return df
+
+def _get_data(event, name, columns, fmt, ttl, refresh, check_schema, filters):
+    # get_data's lookup, recording on event where the frame came from
+    fmt = resolve_format(fmt)
+    dataset = DATASETS[name]
+    db = dataset['db']
+    full_query = dataset['query']
+    sql, params = build_query(name, columns, filters)
+    query = query_key(sql, params)
+    schema = schema_fingerprint(db, dataset['tables']) if check_schema else None
+    entry = None if refresh else find_cache_entry(name, full_query, db, schema, ttl)
+    if entry is None and query != full_query and not refresh:
+        entry = find_cache_entry(name, query, db, schema, ttl)
+    if entry is None:
+        with cache_lock(name):
+            # another worker may have rebuilt the entry while we waited for the lock
+            entry = None if refresh else find_cache_entry(name, query, db, schema, ttl)
+            if entry is None:
+                with _MEMO_LOCK:
+                    _MEMO_STATS['misses'] += 1
+                memoized = False
+                legacy = query == full_query and not (refresh or check_schema)
+                df = migrate_legacy_cache(name, fmt) if legacy else None
+                event['cache'] = 'legacy' if df is not None else 'miss'
+                if df is None:
+                    instrument.message(f'creating df and exporting {fmt}')
+                    if schema is None:
+                        schema = schema_fingerprint(db, dataset['tables'])
+                    # read the SQL query into a dataframe
+                    df = pd.read_sql(bind_query(sql, params), get_engine(db))
+                    # Write that dataframe to disk for later. Called "caching" the data for later.
+                    entry = store_cache_entry(df, name, query, db, schema, fmt)
+                    memoized = memo_put(_memo_key(entry), df)
+                # Return the dataframe to the calling code
+                selected = df if query != full_query else select_frame(df, columns, filters)
+                return _memo_view(selected) if selected is df and memoized else selected
+    # a pushed-down entry already has the filters applied
+    pushed_down = entry['query'] != full_query
+    key = _memo_key(entry, columns, None if pushed_down else filters)
+    df = memo_get(key)
+    event['format'] = entry['format']
+    if df is None:
+        event['cache'] = 'hit'
+        instrument.message(f"{entry['format']} cache found and loaded")
+        df = read_cache(entry['path'], entry['format'], columns, None if pushed_down else filters)
+        if not memo_put(key, df):
+            return df
+    else:
+        event['cache'] = 'memory'
+        instrument.message('df found in memory')
+    return _memo_view(df)
+
+def select_frame(df, columns=None, filters=None):
+    """
+    This function applies a column projection and row filters to an in-memory dataset the same way
+    `read_cache` does for a cached file.
+
+    :param df: a pandas DataFrame
+    :param columns: a list of column names to return, defaults to every column (optional)
+    :param filters: a list of (column, op, value) filters, see FILTER_OPS (optional)
+    :return: the projected and filtered pandas DataFrame.
+    """
+    df = apply_filters(df, filters)
+    return df if columns is None else df[columns]
+
+# streaming
+def read_cache_chunks(filename, fmt, columns=None, chunksize=None):
+    """
+    This function reads a cached dataset in chunks, so only one chunk is held in memory at a time.
+
+    :param filename: path of the cached file
+    :param fmt: the format of the cached file, 'parquet', 'feather' or 'csv'
+    :param columns: a list of column names to load, defaults to every column (optional)
+    :param chunksize: rows per chunk, defaults to CHUNK_SIZE (optional)
+    :return: a generator of pandas DataFrames.
+    """
+    chunksize = chunksize or CHUNK_SIZE
+    if fmt == 'parquet':
+        import pyarrow.parquet as pq
+        parquet_file = pq.ParquetFile(filename, memory_map=True)
+        for batch in parquet_file.iter_batches(batch_size=chunksize, columns=columns):
+            yield batch.to_pandas()
+    elif fmt == 'feather':
+        from pyarrow import feather
+        # memory-mapped, so batches are materialised one at a time
+        table = feather.read_table(filename, columns=columns, memory_map=True)
+        for batch in table.to_batches(max_chunksize=chunksize):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(filename, usecols=columns, chunksize=chunksize)
+
+def _open_chunk_writer(filename, fmt):
+    """
+    Returns (write, close) functions that append DataFrame chunks to a cache file. The columnar
+    formats take their schema from the first chunk; all-null columns in it are typed as strings.
+    """
+    state = {}
+    def write(chunk):
+        if fmt == 'csv':
+            chunk.to_csv(filename, mode='a' if state else 'w', header=not state, index=False)
+            state['started'] = True
+            return
+        import pyarrow as pa
+        if not state:
+            schema = pa.Schema.from_pandas(chunk, preserve_index=False)
+            schema = pa.schema([f.with_type(pa.string()) if pa.types.is_null(f.type) else f
+                                for f in schema], metadata=schema.metadata)
+            if fmt == 'parquet':
+                import pyarrow.parquet as pq
+                state['writer'] = pq.ParquetWriter(filename, schema)
+            else:
+                state['writer'] = pa.ipc.new_file(filename, schema)
+            state['schema'] = schema
+        state['writer'].write_table(pa.Table.from_pandas(chunk, schema=state['schema'],
+                                                         preserve_index=False))
+    def close():
+        writer = state.pop('writer', None)
+        if writer is not None:
+            writer.close()
+    return write, close
+
+def stream_sql(query, db, chunksize=None, dtype=None, params=None):
+    """
+    This function runs a query with a server-side cursor and yields the result in chunks, so the
+    full result is never held in memory.
+
+    :param query: the SQL query text
+    :param db: the name of the database
+    :param chunksize: rows per chunk, defaults to CHUNK_SIZE (optional)
+    :param dtype: column dtypes passed to `pd.read_sql`; pinning them keeps the chunks' dtypes
+    consistent when e.g. an integer column has nulls only in later chunks (optional)
+    :param params: the query's filter parameters from `build_query` (optional)
+    :return: a generator of pandas DataFrames.
+    """
+    with get_engine(db).connect().execution_options(stream_results=True) as conn:
+        yield from pd.read_sql(bind_query(query, params), conn, chunksize=chunksize or CHUNK_SIZE,
+                               dtype=dtype)
+
+def stream_data(name, chunksize=None, columns=None, fmt=None, ttl=None, refresh=False, dtype=None,
+                filters=None):
+    """
+    This function yields a registered dataset in chunks of a set size with bounded memory. It reads
+    from the cache when there is a valid entry; otherwise it streams the query result from the
+    database (with the projection and filters pushed down into the query), writing each chunk to a
+    new cache entry as it arrives. The entry is only published once the whole result has been
+    written, so an abandoned stream leaves no partial cache behind.
+
+    :param name: the name of a dataset registered in DATASETS
+    :param chunksize: rows per chunk, defaults to CHUNK_SIZE (optional)
+    :param columns: a list of column names to return, defaults to every column (optional)
+    :param fmt: the cache format, 'parquet', 'feather' or 'csv', defaults to CACHE_FORMAT (optional)
+    :param ttl: maximum age of a cache entry in seconds, defaults to CACHE_TTL (optional)
+    :param refresh: ignore the cache and query the database again, defaults to False (optional)
+    :param dtype: column dtypes for the database read, see `stream_sql` (optional)
+    :param filters: a list of (column, op, value) row filters, see FILTER_OPS (optional)
+    :return: a generator of pandas DataFrames whose indexes continue from one chunk to the next,
+    so `pd.concat` of the chunks equals the full dataset.
+    """
+    event = {'dataset': name}
+    chunks = _stream_data(event, name, chunksize, columns, fmt, ttl, refresh, dtype, filters)
+    return instrument.timed_chunks('stream_data', chunks, event)
+
+def _stream_data(event, name, chunksize, columns, fmt, ttl, refresh, dtype, filters):
+    # stream_data's generator, recording on event whether it streams from the cache
+    fmt = resolve_format(fmt)
+    dataset = DATASETS[name]
+    db = dataset['db']
+    full_query = dataset['query']
+    sql, params = build_query(name, columns, filters)
+    query = query_key(sql, params)
+    start = 0
+    entry = None if refresh else find_cache_entry(name, full_query, db, ttl=ttl)
+    if entry is None and query != full_query and not refresh:
+        entry = find_cache_entry(name, query, db, ttl=ttl)
+    if entry is not None:
+        event.update(cache='hit', format=entry['format'])
+        instrument.message(f"{entry['format']} cache found, streaming")
+        pushed_down = entry['query'] != full_query
+        chunks = read_cache_chunks(entry['path'], entry['format'],
+                                   columns if pushed_down else _filter_columns(columns, filters),
+                                   chunksize)
+        for chunk in chunks:
+            if not pushed_down:
+                chunk = select_frame(chunk, columns, filters)
+            chunk.index = pd.RangeIndex(start, start + len(chunk))
+            start += len(chunk)
+            yield chunk
+        return
+    event.update(cache='miss', format=fmt)
+    instrument.message(f'streaming df and exporting {fmt}')
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    schema = schema_fingerprint(db, dataset['tables'])
+    path = _entry_path(name, cache_key(query, db, schema), fmt)
+    fd, tmp = tempfile.mkstemp(dir=CACHE_DIR, prefix='.tmp-')
+    os.close(fd)
+    write, close = _open_chunk_writer(tmp, fmt)
+    try:
+        all_columns = None
+        for chunk in stream_sql(sql, db, chunksize, dtype, params):
+            write(chunk)
+            all_columns = list(chunk.columns)
+            chunk.index = pd.RangeIndex(start, start + len(chunk))
+            start += len(chunk)
+            yield chunk
+        close()
+        if all_columns is not None:
+            os.replace(tmp, path)
+            _commit_entry(name, query, db, schema, fmt, path, start, all_columns)
+    finally:
+        close()
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+# functions
+def get_titanic_data(columns=None, fmt=None, **kwargs):
+    """
+    This function checks if a cached file exists, reads it if it does, and if not, reads data from a
+    SQL database, saves it to the cache, and returns the data.
+    :param columns: a list of column names to load, defaults to every column (optional)
+    :param fmt: the cache format, 'parquet', 'feather' or 'csv', defaults to CACHE_FORMAT (optional)
+    :param kwargs: passed on to `get_data`, e.g. filters, ttl, refresh or check_schema (optional)
+    :return: The function `get_titanic_data()` returns a pandas DataFrame containing the Titanic
+    passenger data. If the data has been previously cached, it reads the data from the file (an
+    existing "titanic.csv" is migrated to the cache format). Otherwise, it reads the data from a SQL
+    database, caches it, and returns the DataFrame.
+    """
+    return get_data('titanic', columns, fmt, **kwargs)
+
+def get_iris_data(columns=None, fmt=None, **kwargs):
+    """
+    This function checks if a cached file exists, and if it does, it returns the data from the file,
+    otherwise it reads data from a SQL database, saves it to the cache, and returns the data.
+    :param columns: a list of column names to load, defaults to every column (optional)
+    :param fmt: the cache format, 'parquet', 'feather' or 'csv', defaults to CACHE_FORMAT (optional)
+    :param kwargs: passed on to `get_data`, e.g. filters, ttl, refresh or check_schema (optional)
+    :return: The function `get_iris_data()` returns a pandas DataFrame containing the iris data. If the
+    data is already cached (or in an old "iris.csv" file), it reads the data from the file. Otherwise,
+    it reads the data from a SQL database named "iris_db", joins the "species" and "measurements"
+    tables, caches the data, and returns the DataFrame.
+    """
+    return get_data('iris', columns, fmt, **kwargs)
+
+def get_telco_data(columns=None, fmt=None, **kwargs):
+    """
+    This function reads telco data from the cache if it exists, otherwise it reads the data from a SQL
+    database and saves it to the cache for future use.
+    :param columns: a list of column names to load, defaults to every column (optional)
+    :param fmt: the cache format, 'parquet', 'feather' or 'csv', defaults to CACHE_FORMAT (optional)
+    :param kwargs: passed on to `get_data`, e.g. filters, ttl, refresh or check_schema (optional)
+    :return: The function `get_telco_data()` returns a pandas DataFrame containing data from either the
+    cache (an old "telco.csv" is migrated on first use) or a SQL query from a database named
+    "telco_churn". If the cache exists, it reads the data from the file, otherwise it reads the data
+    from the SQL query, saves it to the cache, and returns the DataFrame.
+    """
+    return get_data('telco', columns, fmt, **kwargs)
+
+def acquire_all(names=None, max_workers=None, **kwargs):
+    """
+    This function loads several registered datasets concurrently on a thread pool. The database
+    reads share the pooled engines from `get_engine`, so the wall time is roughly that of the slowest
+    dataset rather than the sum of all of them.
+
+    :param names: a list of dataset names, defaults to every dataset in DATASETS (optional)
+    :param max_workers: the number of threads, defaults to one per dataset (optional)
+    :param kwargs: passed on to `get_data`, e.g. columns, fmt, ttl or refresh (optional)
+    :return: a dict of dataset name -> pandas DataFrame, and a DataFrame with the wall time, rows
+    and columns of each dataset.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    names = list(DATASETS) if names is None else list(names)
+
+    def timed_load(name):
+        start = time.perf_counter()
+        df = get_data(name, **kwargs)
+        return df, time.perf_counter() - start
+
+    start = time.perf_counter()
+    with instrument.stage('acquire_all', datasets=names), \
+            ThreadPoolExecutor(max_workers=max_workers or len(names) or 1) as pool:
+        results = dict(zip(names, pool.map(timed_load, names)))
+    timings = pd.DataFrame({
+        'dataset': names,
+        'seconds': [round(results[name][1], 3) for name in names],
+        'rows': [results[name][0].shape[0] for name in names],
+        'columns': [results[name][0].shape[1] for name in names],
+    })
+    instrument.message(str(timings))
+    instrument.message(f'total -> {round(time.perf_counter() - start, 3)}s')
+    return {name: results[name][0] for name in names}, timings
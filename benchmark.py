@@ -0,0 +1,257 @@
+# imports
+import io
+import os
+import sys
+import json
+import time
+import tempfile
+import platform
+import subprocess
+import tracemalloc
+from contextlib import redirect_stdout
+import pandas as pd
+import prepare
+
+# packages the entry modules must not load at import time; they are imported by the functions
+# that use them
+HEAVY_IMPORTS = ('matplotlib', 'seaborn', 'scipy', 'sklearn', 'sqlalchemy')
+ENTRY_MODULES = ('acquire', 'prepare', 'explore', 'sweep', 'evaluate', 'profiler')
+# the prep functions timed for each dataset by `bench_dataset`
+SUITE_PREPS = {
+    'titanic': ['prep_titanic_drp_age', 'prep_titanic_drp_null_age', 'prep_split_titanic_imp_age'],
+    'iris': ['prep_iris', 'prep_split_iris'],
+    'telco': ['prep_telco', 'prep_split_telco'],
+}
+# the prepped frame, target and variables `run_chi2` / `compare_means` are timed on, per dataset;
+# variables the prep replaced (e.g. by dummies) are taken from the raw data
+SUITE_TESTS = {
+    'titanic': ('prep_titanic_drp_null_age', 'survived', ['pclass', 'sex', 'embarked'],
+                ['age', 'fare']),
+    'telco': ('prep_telco', 'churned', ['contract_type', 'payment_type', 'internet_service_type'],
+              ['tenure', 'monthly_charges']),
+}
+
+# functions
+def rows_per_second(rows, seconds):
+    return round(rows / seconds) if seconds else float('inf')
+
+def bench_transform_batches(df, pipeline=None, rows=1_000_000, batch_size=10_000, records=False):
+    """
+    This function measures the scoring throughput of a fitted pipeline's batch transform against
+    running `transform` on every batch.
+
+    :param df: a raw dataframe to fit on and to resample the scoring batches from, e.g. telco data
+    :param pipeline: a PrepPipeline, defaults to one built from prepare.TELCO_PREP; it is fitted on df
+    :param rows: the total number of rows to score, defaults to 1,000,000 (optional)
+    :param batch_size: rows per batch, defaults to 10,000 (optional)
+    :param records: feed the batches as lists of dict records instead of dataframes, defaults to
+    False (optional)
+    :return: a DataFrame with the rows per second of `transform_batches` and of `transform`.
+    """
+    pipeline = (pipeline or prepare.PrepPipeline(**prepare.TELCO_PREP)).fit(df)
+    batch = df.sample(batch_size, replace=True, random_state=42).reset_index(drop=True)
+    if records:
+        batch = batch.to_dict('records')
+    n_batches = max(rows // batch_size, 1)
+
+    start = time.perf_counter()
+    for matrix in pipeline.transform_batches(batch for _ in range(n_batches)):
+        pass
+    array_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(n_batches):
+        pipeline.transform(pd.DataFrame.from_records(batch) if records else batch)
+    frame_seconds = time.perf_counter() - start
+
+    results = pd.DataFrame({
+        'method': ['transform_batches', 'transform'],
+        'rows': [n_batches * batch_size] * 2,
+        'seconds': [round(array_seconds, 3), round(frame_seconds, 3)],
+        'rows_per_second': [rows_per_second(n_batches * batch_size, array_seconds),
+                            rows_per_second(n_batches * batch_size, frame_seconds)],
+    })
+    print(results)
+    return results
+
+def import_profile(module):
+    """
+    This function imports a module in a fresh interpreter with `-X importtime` and parses the report.
+
+    :param module: the module name
+    :return: a dict of every imported module -> cumulative import time in microseconds.
+    """
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    if result.returncode:
+        raise ImportError(f'import {module} failed:\n{result.stderr}')
+    times = {}
+    for line in result.stderr.splitlines():
+        if line.startswith('import time:') and '|' in line:
+            _, cumulative, name = line.split('|')
+            if cumulative.strip().isdigit():
+                times[name.strip()] = int(cumulative)
+    return times
+
+def bench_import_time(modules=ENTRY_MODULES, repeat=3):
+    """
+    This function guards the startup cost of the entry modules: it measures each module's import
+    time in fresh interpreters and flags any module that loads one of HEAVY_IMPORTS at import time.
+
+    :param modules: the modules to import, defaults to ENTRY_MODULES (optional)
+    :param repeat: imports per module, the fastest is reported, defaults to 3 (optional)
+    :return: a DataFrame with module, import_ms, heavy_imports and ok.
+    """
+    metrics = []
+    for module in modules:
+        profiles = [import_profile(module) for _ in range(repeat)]
+        heavy = sorted(name for name in profiles[0] if name.split('.')[0] in HEAVY_IMPORTS
+                       and '.' not in name)
+        metrics.append({'module': module,
+                        'import_ms': round(min(p[module] for p in profiles) / 1000, 1),
+                        'heavy_imports': heavy,
+                        'ok': not heavy})
+    results = pd.DataFrame(metrics)
+    print(results)
+    return results
+
+def git_commit():
+    """
+    This function returns the short hash of the checked out commit, or None outside a git checkout.
+    """
+    result = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__)))
+    return result.stdout.strip() or None
+
+def measure(records, stage, func, *args, memory=True, **kwargs):
+    """
+    This function runs one benchmark stage, with its printed output silenced, and records its wall
+    time. With memory the stage is run a second time under tracemalloc for its peak allocation, so
+    the tracing overhead stays out of the timing.
+
+    :param records: the list to append the stage's record to
+    :param stage: the stage name
+    :param func: the function to run
+    :param args: positional arguments for func
+    :param memory: trace allocations with tracemalloc, defaults to True (optional)
+    :param kwargs: keyword arguments for func
+    :return: the function's return value.
+    """
+    start = time.perf_counter()
+    with redirect_stdout(io.StringIO()):
+        result = func(*args, **kwargs)
+    seconds = time.perf_counter() - start
+    peak = None
+    if memory:
+        tracemalloc.start()
+        try:
+            with redirect_stdout(io.StringIO()):
+                func(*args, **kwargs)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    records.append({'stage': stage, 'seconds': round(seconds, 4),
+                    'peak_mb': None if peak is None else round(peak / 2**20, 1)})
+    return result
+
+def bench_dataset(name, rows, directory, seed=42, memory=True):
+    """
+    This function times every stage of the pipeline on a synthetic dataset: generation, CSV load,
+    SQLite load through `acquire.get_data` (query and cache write) and the cached reload, each prep
+    function, `split_data`, and for datasets with a binary target `run_chi2` / `compare_means` on
+    every test variable and their batched `chi2_all` / `mannwhitney_all` equivalents.
+
+    :param name: 'titanic', 'iris' or 'telco'
+    :param rows: the number of synthetic rows
+    :param directory: a scratch directory for the CSV, SQLite database and caches
+    :param seed: the random seed of the data, defaults to 42 (optional)
+    :param memory: trace peak allocations, defaults to True (optional)
+    :return: a list of records with dataset, rows, stage, seconds and peak_mb.
+    """
+    import acquire
+    import explore
+    import synthetic
+    # import what the stages load lazily up front, so no stage is charged for a first import
+    import sqlalchemy, sklearn.model_selection, scipy.stats
+    records = []
+    df = measure(records, 'generate', synthetic.synthetic_data, name, rows, seed, memory=memory)
+    csv = os.path.join(directory, f'{name}.csv')
+    df.to_csv(csv, index=False)
+    measure(records, 'load_csv', pd.read_csv, csv, memory=memory)
+    del df
+
+    sqlite = synthetic.write_sqlite(name, rows, os.path.join(directory, f'{name}.sqlite'), seed)
+    db = acquire.DATASETS[name]['db']
+    saved = acquire.DB_URLS.get(db), acquire.CACHE_DIR, prepare.SPLIT_CACHE_DIR
+    acquire.DB_URLS[db] = f'sqlite:///{sqlite}'
+    acquire.CACHE_DIR = os.path.join(directory, 'data_cache')
+    prepare.SPLIT_CACHE_DIR = os.path.join(directory, 'split_cache')
+    try:
+        measure(records, 'load_sqlite', acquire.get_data, name, refresh=True, memory=memory)
+        acquire.clear_memo()
+        df = measure(records, 'load_cache', acquire.get_data, name, memory=memory)
+        acquire.clear_memo()
+        prepped = {}
+        for prep in SUITE_PREPS[name]:
+            prepped[prep] = measure(records, prep, getattr(prepare, prep), df, memory=memory)
+        if name in SUITE_TESTS:
+            prep, target, cat_vars, quant_vars = SUITE_TESTS[name]
+            data = prepped[prep]
+            data = data.assign(**{c: df[c] for c in cat_vars + quant_vars if c not in data})
+        else:
+            target, cat_vars, quant_vars, data = 'species', [], [], prepped['prep_iris']
+        train, _, _ = measure(records, 'split_data', prepare.split_data, data, target,
+                              memory=memory)
+        for cat in cat_vars:
+            measure(records, f'run_chi2:{cat}', explore.run_chi2, train, cat, target, memory=memory)
+        for quant in quant_vars:
+            measure(records, f'compare_means:{quant}', explore.compare_means, train, target, quant,
+                    memory=memory)
+        if cat_vars:
+            measure(records, 'chi2_all', explore.chi2_all, train, target, cat_vars, memory=memory)
+            measure(records, 'mannwhitney_all', explore.mannwhitney_all, train, target, quant_vars,
+                    memory=memory)
+    finally:
+        acquire.dispose_engines()
+        acquire.clear_memo()
+        acquire.DB_URLS[db], acquire.CACHE_DIR, prepare.SPLIT_CACHE_DIR = saved
+        if saved[0] is None:
+            del acquire.DB_URLS[db]
+    return [dict(dataset=name, rows=rows, **record) for record in records]
+
+def run_suite(sizes=(100_000,), datasets=('titanic', 'iris', 'telco'), output='benchmark_results.jsonl',
+              seed=42, memory=True):
+    """
+    This function runs `bench_dataset` for every dataset and size and appends the results as JSON
+    lines tagged with the commit, so runs on different commits can be compared, e.g.
+    pd.read_json('benchmark_results.jsonl', lines=True).pivot_table('seconds', 'stage', 'commit').
+
+    :param sizes: the row counts to generate, e.g. (10**5, 10**6, 10**7), defaults to (100_000,)
+    :param datasets: the datasets to benchmark, defaults to all three (optional)
+    :param output: the JSON lines file to append to, defaults to 'benchmark_results.jsonl' (optional)
+    :param seed: the random seed of the data, defaults to 42 (optional)
+    :param memory: trace peak allocations (slower), defaults to True (optional)
+    :return: a DataFrame of this run's records.
+    """
+    run = {'commit': git_commit(), 'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+           'python': platform.python_version(), 'pandas': pd.__version__}
+    records = []
+    for name in datasets:
+        for rows in sizes:
+            with tempfile.TemporaryDirectory() as directory:
+                records += [dict(run, **record) for record in bench_dataset(name, rows, directory,
+                                                                              seed, memory)]
+            print(f'{name} x {rows:,} benchmarked')
+    with open(output, 'a') as f:
+        for record in records:
+            f.write(json.dumps(record) + '\n')
+    results = pd.DataFrame(records)
+    print(results[['dataset', 'rows', 'stage', 'seconds', 'peak_mb']])
+    return results
+
+if __name__ == '__main__':
+    if not bench_import_time().ok.all():
+        sys.exit('heavy imports at module load, see heavy_imports above')
+    run_suite(sizes=[int(n) for n in sys.argv[1:]] or (100_000,))
+    import synthetic
+    bench_transform_batches(synthetic.synthetic_telco(100_000))
@@ -0,0 +1,103 @@
+# imports
+import numpy as np
+import pandas as pd
+
+# functions
+def model_columns(df, actual='actual', models=None):
+    """
+    This function lists the prediction columns to evaluate.
+
+    :param df: a dataframe with one actual column and one prediction column per model
+    :param actual: the name of the actual column, defaults to 'actual' (optional)
+    :param models: a list of prediction columns, defaults to every column except actual (optional)
+    :return: a list of prediction column names.
+    """
+    return [c for c in df.columns if c != actual] if models is None else list(models)
+
+def confusion_matrices(df, actual='actual', models=None, chunk_size=1_000_000):
+    """
+    This function builds the confusion matrix of every model in one pass: the actual and predicted
+    columns are encoded one column at a time into small integer codes against one shared label
+    index, and each chunk of rows adds to every model's matrix with a bincount over (actual,
+    predicted) codes, so memory stays bounded by the chunk whatever the number of models.
+
+    :param df: a dataframe with one actual column and one prediction column per model
+    :param actual: the name of the actual column, defaults to 'actual' (optional)
+    :param models: a list of prediction columns, defaults to every column except actual (optional)
+    :param chunk_size: cells (rows times columns) encoded per chunk, defaults to 1,000,000 (optional)
+    :return: the sorted labels (pandas Index), the model names and a (models, labels, labels) array of
+    counts, rows actual and columns predicted, like sklearn's confusion_matrix.
+    """
+    models = model_columns(df, actual, models)
+    labels = pd.Index(sorted(set().union(*(pd.unique(df[c].dropna()) for c in [actual] + models))))
+    n_models, n_labels = len(models), len(labels)
+    counts = np.zeros((n_models, n_labels * n_labels), dtype=np.int64)
+    rows = max(chunk_size // (n_models + 1), 1)
+    for start in range(0, len(df), rows):
+        # int8/int16 codes, -1 for missing values
+        truth = pd.Categorical(df[actual].iloc[start:start + rows], categories=labels).codes
+        for i, model in enumerate(models):
+            predicted = pd.Categorical(df[model].iloc[start:start + rows], categories=labels).codes
+            # rows with a missing actual or prediction are left out of that model's matrix
+            keep = (truth >= 0) & (predicted >= 0)
+            flat = truth[keep].astype(np.intp) * n_labels + predicted[keep]
+            counts[i] += np.bincount(flat, minlength=n_labels * n_labels)
+    return labels, models, counts.reshape(n_models, n_labels, n_labels)
+
+def matrix_metrics(labels, models, matrices):
+    """
+    This function computes per-class precision, recall, f1-score and support plus accuracy for every
+    model from its confusion matrix, with 0 wherever a ratio has no cases (sklearn's default).
+
+    :param labels: the labels from `confusion_matrices`
+    :param models: the model names from `confusion_matrices`
+    :param matrices: the (models, labels, labels) counts from `confusion_matrices`
+    :return: a DataFrame with one row per model and label: model, label, precision, recall,
+    f1-score, support and accuracy (the model's overall accuracy).
+    """
+    true_pos = np.diagonal(matrices, axis1=1, axis2=2).astype(np.float64)
+    support = matrices.sum(axis=2)
+    predicted = matrices.sum(axis=1)
+    precision = np.divide(true_pos, predicted, out=np.zeros_like(true_pos), where=predicted > 0)
+    recall = np.divide(true_pos, support, out=np.zeros_like(true_pos), where=support > 0)
+    total = precision + recall
+    f1 = np.divide(2 * precision * recall, total, out=np.zeros_like(true_pos), where=total > 0)
+    n_rows = support.sum(axis=1, keepdims=True)
+    accuracy = np.divide(true_pos.sum(axis=1, keepdims=True), n_rows,
+                         out=np.zeros(n_rows.shape), where=n_rows > 0)
+    return pd.DataFrame({
+        'model': np.repeat(models, len(labels)),
+        'label': np.tile(labels, len(models)),
+        'precision': precision.ravel(),
+        'recall': recall.ravel(),
+        'f1-score': f1.ravel(),
+        'support': support.ravel(),
+        'accuracy': np.repeat(accuracy.ravel(), len(labels)),
+    })
+
+def evaluate_models(df, actual='actual', models=None, chunk_size=1_000_000):
+    """
+    This function scores every prediction column against the actual column at once, replacing the
+    per-model accuracy, precision and recall loops.
+
+    :param df: a dataframe with one actual column and one prediction column per model
+    :param actual: the name of the actual column, defaults to 'actual' (optional)
+    :param models: a list of prediction columns, defaults to every column except actual (optional)
+    :param chunk_size: cells (rows times columns) encoded per chunk, defaults to 1,000,000 (optional)
+    :return: a DataFrame with one row per model and label, see `matrix_metrics`; e.g.
+    evaluate_models(c3).query("label == 'Defect'").sort_values('recall') ranks models by recall.
+    """
+    return matrix_metrics(*confusion_matrices(df, actual, models, chunk_size))
+
+def confusion_frame(df, model, actual='actual'):
+    """
+    This function shows one model's confusion matrix with labelled rows (actual) and columns
+    (predicted).
+
+    :param df: a dataframe with one actual column and one prediction column per model
+    :param model: the prediction column
+    :param actual: the name of the actual column, defaults to 'actual' (optional)
+    :return: a DataFrame of counts.
+    """
+    labels, _, matrices = confusion_matrices(df, actual, [model])
+    return pd.DataFrame(matrices[0], index=labels.rename(actual), columns=labels.rename(model))
@@ -1,9 +1,38 @@
+import os
+import json
+import hashlib
+import tempfile
+import importlib
+from concurrent.futures import ProcessPoolExecutor
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
-from sklearn.model_selection import train_test_split
-from scipy import stats
+from prepare import split_indices
+from profiler import profile_frame
+import instrument
+
+class _LazyModule:
+    """
+    A stand-in for a module that is only imported on first attribute access, so importing explore
+    (e.g. in a worker that only needs the statistics or the split) does not load the plotting stack.
+    """
+    def __init__(self, name):
+        self._name = name
+
+    def __getattr__(self, attr):
+        return getattr(importlib.import_module(self._name), attr)
+
+plt = _LazyModule('matplotlib.pyplot')
+sns = _LazyModule('seaborn')
+stats = _LazyModule('scipy.stats')
+
+# large data: point-based plots (swarms, pairplot scatters) draw at most POINT_BUDGET rows; above it
+# LARGE_DATA_FALLBACK 'sample' plots a stratified sample, 'density' switches to violins and 2D histograms
+# (POINT_BUDGET = None always plots every row)
+POINT_BUDGET = 1_000
+LARGE_DATA_FALLBACK = 'sample'
+
+# worker state for report rendering: the data, loaded once per worker process
+_REPORT_DATA = {}
 
 def train_validate_test_split(df, target, seed=42):
     """
@@ -18,18 +47,17 @@ def train_validate_test_split(df, target, seed=42):
     the input dataframe into three subsets for training, validation, and testing machine learning
     models.
     """
-    train_validate, test = train_test_split(df, test_size=0.2, 
-                                            random_state=seed, 
-                                            stratify=df[target])
-    train, validate = train_test_split(train_validate, test_size=0.3, 
-                                        random_state=seed,
-                                        stratify=train_validate[target])
+    train, validate, test = split_indices(df, target, test=0.2, validate=0.3, seed=seed)
+    train, validate, test = df.iloc[train], df.iloc[validate], df.iloc[test]
     return train, validate, test
 
 
-def explore_univariate(train, cat_vars, quant_vars):
+@instrument.timed
+def explore_univariate(train, cat_vars, quant_vars, profile=None):
     """
-    The function explores univariate categorical and quantitative variables in a given dataset.
+    The function explores univariate categorical and quantitative variables in a given dataset. Every
+    table and plot is built from one single-pass profile of the data instead of rescanning train per
+    variable.
     
     :param train: This parameter is likely a pandas DataFrame containing the training data for a machine
     learning model
@@ -37,15 +65,21 @@ def explore_univariate(train, cat_vars, quant_vars):
     :param quant_vars: Quantitative variables, also known as numerical variables, are variables that
     represent a numeric value, such as age, income, or height. These variables can be measured and
     analyzed using mathematical and statistical methods
+    :param profile: a `profiler.DatasetProfile` of the data, e.g. cached or built from
+    `acquire.stream_data` chunks with `profiler.profile_chunks` (train may then be None); defaults to
+    profiling train (optional)
     """
+    if profile is None:
+        profile = profile_frame(train[list(cat_vars) + list(quant_vars)])
     for var in cat_vars:
-        explore_univariate_categorical(train, var)
+        explore_univariate_categorical(train, var, profile=profile)
         print('_________________________________________________________________')
     for col in quant_vars:
-        p, descriptive_stats = explore_univariate_quant(train, col)
-        plt.show(p)
+        p, descriptive_stats = explore_univariate_quant(train, col, profile=profile)
+        plt.show()
         print(descriptive_stats)
 
+@instrument.timed
 def explore_bivariate(train, target, cat_vars, quant_vars):
     """
     The function explores bivariate relationships between categorical and quantitative variables in a
@@ -64,6 +98,7 @@ def explore_bivariate(train, target, cat_vars, quant_vars):
     for quant in quant_vars:
         explore_bivariate_quant(train, target, quant)
 
+@instrument.timed
 def explore_multivariate(train, target, cat_vars, quant_vars):
     """
     The function explores multivariate relationships between variables in a dataset using various
@@ -79,42 +114,56 @@ def explore_multivariate(train, target, cat_vars, quant_vars):
     height, weight, and temperature
     """
     plot_swarm_grid_with_color(train, target, cat_vars, quant_vars)
-    plt.show()
-    violin = plot_violin_grid_with_color(train, target, cat_vars, quant_vars)
-    plt.show()
-    pair = sns.pairplot(data=train, vars=quant_vars, hue=target)
+    plot_violin_grid_with_color(train, target, cat_vars, quant_vars)
+    plot_pairplot(train, target, quant_vars)
     plt.show()
     plot_all_continuous_vars(train, target, quant_vars)
-    plt.show()    
 
 
 ### Univariate
 
-def explore_univariate_categorical(train, cat_var):
+def explore_univariate_categorical(train, cat_var, profile=None):
     """
     This function creates a frequency table and a bar plot for a categorical variable in a given
     dataset.
     
     :param train: The training dataset containing the categorical variable to be explored
     :param cat_var: The categorical variable that we want to explore
+    :param profile: a `profiler.DatasetProfile` to read the counts from instead of train (optional)
+    """
+    frequency_table = plot_univariate_categorical(train, cat_var, profile)
+    plt.show()
+    print(frequency_table)
+
+def plot_univariate_categorical(train, cat_var, profile=None):
+    """
+    This function draws the bar plot of a categorical variable's frequency table.
+
+    :param train: The training dataset containing the categorical variable to be explored
+    :param cat_var: The categorical variable that we want to explore
+    :param profile: a `profiler.DatasetProfile` to read the counts from instead of train (optional)
+    :return: the frequency table from `freq_table`.
     """
-    frequency_table = freq_table(train, cat_var)
+    frequency_table = profile.freq_table(cat_var) if profile is not None else freq_table(train, cat_var)
     plt.figure(figsize=(2,2))
     sns.barplot(x=cat_var, y='Count', data=frequency_table, color='lightseagreen')
     plt.title(cat_var)
-    plt.show()
-    print(frequency_table)
+    return frequency_table
 
-def explore_univariate_quant(train, quant_var):
+def explore_univariate_quant(train, quant_var, profile=None):
     """
     The function explores a univariate quantitative variable by creating a histogram and box plot and
     returning descriptive statistics.
     
     :param train: a pandas DataFrame containing the training data
     :param quant_var: The variable name of the quantitative variable that we want to explore
+    :param profile: a `profiler.DatasetProfile` to draw from instead of train; its quartiles and
+    histogram are sketch estimates for high-cardinality columns (optional)
     :return: two values: the plots for the histogram and boxplot of the specified quantitative variable,
     and the descriptive statistics of that variable.
     """
+    if profile is not None:
+        return plot_profile_quant(profile, quant_var)
     descriptive_stats = train[quant_var].describe()
     plt.figure(figsize=(8,2))
 
@@ -128,6 +177,33 @@ def explore_univariate_quant(train, quant_var):
     p = plt.title(quant_var)
     return p, descriptive_stats
 
+def plot_profile_quant(profile, quant_var):
+    """
+    The function draws the histogram and box plot of `explore_univariate_quant` from a profile.
+
+    :param profile: a `profiler.DatasetProfile`
+    :param quant_var: The variable name of the quantitative variable that we want to explore
+    :return: the plots and the descriptive statistics, like `explore_univariate_quant`.
+    """
+    descriptive_stats = profile.describe(quant_var)
+    counts, edges = profile.histogram(quant_var)
+    plt.figure(figsize=(8,2))
+
+    p = plt.subplot(1, 2, 1)
+    p = plt.hist(edges[:-1], bins=edges, weights=counts, color='lightseagreen')
+    p = plt.title(quant_var)
+
+    # second plot: box plot, whiskers at the furthest data within 1.5 IQR (estimated by min and max)
+    q1, med, q3 = descriptive_stats[['25%', '50%', '75%']]
+    iqr = q3 - q1
+    box = {'med': med, 'q1': q1, 'q3': q3, 'fliers': [],
+           'whislo': max(descriptive_stats['min'], q1 - 1.5 * iqr),
+           'whishi': min(descriptive_stats['max'], q3 + 1.5 * iqr)}
+    p = plt.subplot(1, 2, 2)
+    p = plt.gca().bxp([box])
+    p = plt.title(quant_var)
+    return p, descriptive_stats
+
 def freq_table(train, cat_var):
     """
     The function creates a frequency table for a categorical variable in a given dataset.
@@ -139,19 +215,50 @@ def freq_table(train, cat_var):
     categorical variable in a given dataset, along with the count and percentage of each value in the
     dataset.
     """
-    class_labels = list(train[cat_var].unique())
+    counts = train[cat_var].value_counts().rename_axis(None)
 
     return pd.DataFrame(
         {
-            cat_var: class_labels,
-            'Count': train[cat_var].value_counts(normalize=False),
-            'Percent': round(
-                train[cat_var].value_counts(normalize=True) * 100, 2
-            ),
+            cat_var: counts.index,
+            'Count': counts,
+            'Percent': round(counts / counts.sum() * 100, 2),
         }
     )
 
 
+### Large data
+
+def sample_for_plot(train, target=None, budget=None, seed=42):
+    """
+    The function draws a stratified sample of at most budget rows that keeps the target's class
+    balance, or returns the data unchanged when it already fits.
+
+    :param train: a pandas DataFrame containing the training data
+    :param target: the column to stratify on, defaults to None (simple random sample) (optional)
+    :param budget: the largest number of rows to plot, defaults to POINT_BUDGET (optional)
+    :param seed: the random seed of the sample, defaults to 42 (optional)
+    :return: a DataFrame with at most about budget rows.
+    """
+    budget = POINT_BUDGET if budget is None else budget
+    if not budget or len(train) <= budget:
+        return train
+    if target is None:
+        return train.sample(budget, random_state=seed)
+    return train.groupby(target, group_keys=False, observed=True).sample(
+        frac=budget / len(train), random_state=seed)
+
+def use_density(train):
+    """
+    The function decides whether point plots of train fall back to density renderings.
+
+    :param train: a pandas DataFrame containing the data to plot
+    :return: True when train is over POINT_BUDGET and LARGE_DATA_FALLBACK is 'density'.
+    """
+    if LARGE_DATA_FALLBACK not in ('sample', 'density'):
+        raise ValueError("LARGE_DATA_FALLBACK must be 'sample' or 'density'")
+    return bool(POINT_BUDGET) and len(train) > POINT_BUDGET and LARGE_DATA_FALLBACK == 'density'
+
+
 #### Bivariate
 
 def explore_bivariate_categorical(train, target, cat_var):
@@ -167,14 +274,17 @@ def explore_bivariate_categorical(train, target, cat_var):
     target variable
     """
     print(cat_var, "\n_____________________\n")
-    ct = pd.crosstab(train[cat_var], train[target], margins=True)
     chi2_summary, observed, expected = run_chi2(train, cat_var, target)
+    # add the margins to the observed table instead of counting a second crosstab
+    ct = observed.copy()
+    ct['All'] = ct.sum(axis=1)
+    ct.loc['All'] = ct.sum()
     p = plot_cat_by_target(train, target, cat_var)
 
     print(chi2_summary)
     print("\nobserved:\n", ct)
     print("\nexpected:\n", expected)
-    plt.show(p)
+    plt.show()
     print("\n_____________________\n")
 
 def explore_bivariate_quant(train, target, quant_var):
@@ -194,16 +304,27 @@ def explore_bivariate_quant(train, target, quant_var):
     descriptive_stats = train.groupby(target)[quant_var].describe()
     average = train[quant_var].mean()
     mann_whitney = compare_means(train, target, quant_var)
-    plt.figure(figsize=(4,4))
-    boxen = plot_boxen(train, target, quant_var)
-    swarm = plot_swarm(train, target, quant_var)
+    plot_bivariate_quant(train, target, quant_var)
     plt.show()
     print(descriptive_stats, "\n")
     print("\nMann-Whitney Test:\n", mann_whitney)
     print("\n____________________\n")
 
+def plot_bivariate_quant(train, target, quant_var):
+    """
+    The function draws a boxen plot with a swarm plot on top for a quantitative variable by target.
+
+    :param train: a pandas DataFrame containing the training data
+    :param target: the target variable to group by on the x-axis
+    :param quant_var: The quantitative variable to plot on the y-axis
+    """
+    plt.figure(figsize=(4,4))
+    plot_boxen(train, target, quant_var)
+    plot_swarm(train, target, quant_var)
+
 ## Bivariate Categorical
 
+@instrument.timed
 def run_chi2(train, cat_var, target):
     """
     The function calculates the chi-squared test statistic, p-value, degrees of freedom, and expected
@@ -243,7 +364,7 @@ def plot_cat_by_target(train, target, cat_var):
     in the dataset.
     """
     p = plt.figure(figsize=(2,2))
-    p = sns.barplot(cat_var, target, data=train, alpha=.8, color='lightseagreen')
+    p = sns.barplot(x=cat_var, y=target, data=train, alpha=.8, color='lightseagreen')
     overall_rate = train[target].mean()
     p = plt.axhline(overall_rate, ls='--', color='gray')
     return p
@@ -263,7 +384,10 @@ def plot_swarm(train, target, quant_var):
     :return: the plot object `p`.
     """
     average = train[quant_var].mean()
-    p = sns.swarmplot(data=train, x=target, y=quant_var, color='lightgray')
+    if use_density(train):
+        p = sns.violinplot(data=train, x=target, y=quant_var, color='lightgray', inner=None)
+    else:
+        p = sns.swarmplot(data=sample_for_plot(train, target), x=target, y=quant_var, color='lightgray')
     p = plt.title(quant_var)
     p = plt.axhline(average, ls='--', color='black')
     return p
@@ -292,6 +416,7 @@ def plot_boxen(train, target, quant_var):
 
 # alt_hyp = ‘two-sided’, ‘less’, ‘greater’
 
+@instrument.timed
 def compare_means(train, target, quant_var, alt_hyp='two-sided'):
     """
     The function compares the means of two groups using the Mann-Whitney U test and returns the test
@@ -315,6 +440,108 @@ def compare_means(train, target, quant_var, alt_hyp='two-sided'):
     return stats.mannwhitneyu(x, y, use_continuity=True, alternative=alt_hyp)
 
 
+## Batch tests
+
+@instrument.timed
+def chi2_all(train, target, cat_vars):
+    """
+    The function runs the chi-squared test of independence between the target and every categorical
+    variable at once: all contingency tables are counted in one bincount pass and the statistics are
+    computed together, matching `run_chi2` (Yates' correction for 2x2 tables, as in scipy).
+
+    :param train: a pandas DataFrame containing the training data
+    :param target: the name of the target column
+    :param cat_vars: a list of categorical variables to test
+    :return: a DataFrame with one row per variable: variable, chi2, p-value and degrees of freedom.
+    """
+    target_codes, target_levels = pd.factorize(train[target])
+    n_cols = len(target_levels)
+    codes = [pd.factorize(train[col]) for col in cat_vars]
+    n_rows = max([len(levels) for _, levels in codes], default=0)
+    flat = []
+    for i, (col_codes, _) in enumerate(codes):
+        keep = (col_codes >= 0) & (target_codes >= 0)
+        flat.append((i * n_rows + col_codes[keep]) * n_cols + target_codes[keep])
+    observed = np.bincount(np.concatenate(flat) if flat else np.array([], dtype=np.intp),
+                           minlength=len(cat_vars) * n_rows * n_cols)
+    observed = observed.reshape(len(cat_vars), n_rows, n_cols).astype(np.float64)
+    row_totals, col_totals = observed.sum(axis=2), observed.sum(axis=1)
+    n = row_totals.sum(axis=1)
+    expected = row_totals[:, :, None] * col_totals[:, None, :] / np.maximum(n, 1)[:, None, None]
+    degf = ((row_totals > 0).sum(axis=1) - 1) * ((col_totals > 0).sum(axis=1) - 1)
+    # Yates' correction: move each count half a unit towards its expected count
+    diff = expected - observed
+    yates = (degf == 1)[:, None, None]
+    observed = np.where(yates, observed + np.sign(diff) * np.minimum(0.5, np.abs(diff)), observed)
+    terms = np.divide((observed - expected) ** 2, expected, out=np.zeros_like(expected),
+                      where=expected > 0)
+    chi2 = np.where(degf > 0, terms.sum(axis=(1, 2)), 0.0)
+    p = np.where(degf > 0, stats.chi2.sf(chi2, np.maximum(degf, 1)), 1.0)
+    return pd.DataFrame({'variable': list(cat_vars), 'chi2': chi2, 'p-value': p,
+                         'degrees of freedom': degf})
+
+@instrument.timed
+def mannwhitney_all(train, target, quant_vars, alt_hyp='two-sided'):
+    """
+    The function runs `compare_means`' Mann-Whitney U test (target 0 vs target 1) for every
+    quantitative variable at once: one rank pass over all columns, tie counts from the min and max
+    ranks, and the normal approximation with continuity correction that scipy uses for large
+    samples. Missing values are left out per column.
+
+    :param train: a pandas DataFrame containing the training data
+    :param target: the name of the binary (0/1) target column
+    :param quant_vars: a list of quantitative variables to test
+    :param alt_hyp: 'two-sided' (default), 'less' or 'greater', as in `compare_means` (optional)
+    :return: a DataFrame with one row per variable: variable, statistic (U of the target 0 group)
+    and p-value.
+    """
+    data = train.loc[train[target].isin([0, 1]), quant_vars]
+    is_x = (train.loc[data.index, target] == 0).to_numpy()[:, None]
+    present = data.notna().to_numpy()
+    ranks = data.rank().to_numpy()
+    # every member of a tie group of size t adds t**2 - 1, so the column sums are sum(t**3 - t)
+    ties = data.rank(method='max').to_numpy() - data.rank(method='min').to_numpy() + 1
+    tie_term = np.nansum(ties ** 2 - 1, axis=0)
+    n1 = (present & is_x).sum(axis=0)
+    n2 = (present & ~is_x).sum(axis=0)
+    n = n1 + n2
+    u1 = np.nansum(np.where(is_x, ranks, 0), axis=0) - n1 * (n1 + 1) / 2
+    u2 = n1 * n2 - u1
+    mu = n1 * n2 / 2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sigma = np.sqrt(n1 * n2 / 12 * ((n + 1) - tie_term / (n * (n - 1))))
+        if alt_hyp == 'two-sided':
+            p = np.minimum(2 * stats.norm.sf((np.maximum(u1, u2) - mu - 0.5) / sigma), 1.0)
+        elif alt_hyp == 'greater':
+            p = stats.norm.sf((u1 - mu - 0.5) / sigma)
+        elif alt_hyp == 'less':
+            p = stats.norm.sf((u2 - mu - 0.5) / sigma)
+        else:
+            raise ValueError("alt_hyp must be 'two-sided', 'less' or 'greater'")
+    return pd.DataFrame({'variable': list(quant_vars), 'statistic': u1, 'p-value': p})
+
+@instrument.timed
+def screen_features(train, target, cat_vars, quant_vars, alt_hyp='two-sided'):
+    """
+    The function screens every variable against the target without plotting: chi-squared tests
+    for the categorical variables and Mann-Whitney tests for the quantitative ones.
+
+    :param train: a pandas DataFrame containing the training data
+    :param target: the name of the target column (0/1 for the Mann-Whitney tests)
+    :param cat_vars: a list of categorical variables in the dataset
+    :param quant_vars: a list of quantitative variables in the dataset
+    :param alt_hyp: the Mann-Whitney alternative hypothesis, defaults to 'two-sided' (optional)
+    :return: a DataFrame with variable, test, statistic, p-value and degrees of freedom, sorted by
+    p-value.
+    """
+    chi2 = chi2_all(train, target, cat_vars).rename(columns={'chi2': 'statistic'})
+    mann_whitney = mannwhitney_all(train, target, quant_vars, alt_hyp)
+    summary = pd.concat([chi2.assign(test='chi2'), mann_whitney.assign(test='mann-whitney')],
+                        ignore_index=True)
+    summary = summary[['variable', 'test', 'statistic', 'p-value', 'degrees of freedom']]
+    return summary.sort_values('p-value', ignore_index=True)
+
+
 ### Multivariate
 
 def plot_all_continuous_vars(train, target, quant_vars):
@@ -328,13 +555,36 @@ def plot_all_continuous_vars(train, target, quant_vars):
     :param quant_vars: a list of column names in the training dataset that contain continuous variables
     (numeric data that can take on any value within a range)
     """
+    plot_continuous_boxen(train, target, quant_vars)
+    plt.show()
+
+def plot_continuous_boxen(train, target, quant_vars):
+    """
+    This function draws the boxenplots of `plot_all_continuous_vars` on one log-scaled figure.
+
+    :param train: a pandas DataFrame containing the training data
+    :param target: the target variable used for the hue
+    :param quant_vars: a list of column names in the training dataset that contain continuous variables
+    """
     my_vars = [item for sublist in [quant_vars, [target]] for item in sublist]
     sns.set(style="whitegrid", palette="muted")
     melt = train[my_vars].melt(id_vars=target, var_name="measurement")
     plt.figure(figsize=(8,6))
     p = sns.boxenplot(x="measurement", y="value", hue=target, data=melt)
-    p.set(yscale="log", xlabel='')    
-    plt.show()
+    p.set(yscale="log", xlabel='')
+
+def plot_pairplot(train, target, quant_vars):
+    """
+    This function draws the pairplot of the quantitative variables colored by target.
+
+    :param train: a pandas DataFrame containing the training data
+    :param target: the target variable used for the hue
+    :param quant_vars: a list of quantitative variables
+    :return: the seaborn PairGrid.
+    """
+    if use_density(train):
+        return sns.pairplot(data=train, vars=quant_vars, hue=target, kind='hist', diag_kind='hist')
+    return sns.pairplot(data=sample_for_plot(train, target), vars=quant_vars, hue=target)
 
 def plot_violin_grid_with_color(train, target, cat_vars, quant_vars):
     """
@@ -349,17 +599,28 @@ def plot_violin_grid_with_color(train, target, cat_vars, quant_vars):
     :param quant_vars: quant_vars are the quantitative variables (numerical variables) that we want to
     plot on the y-axis of the violin plots
     """
-    cols = len(cat_vars)
     for quant in quant_vars:
-        _, ax = plt.subplots(nrows=1, ncols=cols, figsize=(16, 4), sharey=True)
-        for i, cat in enumerate(cat_vars):
-            sns.violinplot(x=cat, y=quant, data=train, split=True, 
-                            ax=ax[i], hue=target, palette="Set2")
-            ax[i].set_xlabel('')
-            ax[i].set_ylabel(quant)
-            ax[i].set_title(cat)
+        plot_violin_row(train, target, cat_vars, quant)
         plt.show()
 
+def plot_violin_row(train, target, cat_vars, quant):
+    """
+    This function draws one row of the violin grid: a quantitative variable against every categorical
+    variable, split by target.
+
+    :param train: a pandas DataFrame containing the training data
+    :param target: the target variable used for the hue
+    :param cat_vars: A list of categorical variables to be plotted on the x-axis of the violin plots
+    :param quant: the quantitative variable to plot on the y-axis
+    """
+    _, ax = plt.subplots(nrows=1, ncols=len(cat_vars), figsize=(16, 4), sharey=True, squeeze=False)
+    for i, cat in enumerate(cat_vars):
+        sns.violinplot(x=cat, y=quant, data=train, split=True,
+                        ax=ax[0, i], hue=target, palette="Set2")
+        ax[0, i].set_xlabel('')
+        ax[0, i].set_ylabel(quant)
+        ax[0, i].set_title(cat)
+
 def plot_swarm_grid_with_color(train, target, cat_vars, quant_vars):
     """
     This function plots a grid of swarmplots for categorical and quantitative variables with color-coded
@@ -373,12 +634,199 @@ def plot_swarm_grid_with_color(train, target, cat_vars, quant_vars):
     :param quant_vars: quant_vars are the quantitative variables (numeric variables) that we want to
     plot in the swarm plot
     """
-    cols = len(cat_vars)
     for quant in quant_vars:
-        _, ax = plt.subplots(nrows=1, ncols=cols, figsize=(16, 4), sharey=True)
-        for i, cat in enumerate(cat_vars):
-            sns.swarmplot(x=cat, y=quant, data=train, ax=ax[i], hue=target, palette="Set2")
-            ax[i].set_xlabel('')
-            ax[i].set_ylabel(quant)
-            ax[i].set_title(cat)
-        plt.show()
\ No newline at end of file
+        plot_swarm_row(train, target, cat_vars, quant)
+        plt.show()
+
+def plot_swarm_row(train, target, cat_vars, quant):
+    """
+    This function draws one row of the swarm grid: a quantitative variable against every categorical
+    variable, colored by target.
+
+    :param train: a pandas DataFrame containing the training data
+    :param target: the target variable used for the hue
+    :param cat_vars: A list of categorical variables to be plotted on the x-axis of the swarm plots
+    :param quant: the quantitative variable to plot on the y-axis
+    """
+    density = use_density(train)
+    data = train if density else sample_for_plot(train, target)
+    _, ax = plt.subplots(nrows=1, ncols=len(cat_vars), figsize=(16, 4), sharey=True, squeeze=False)
+    for i, cat in enumerate(cat_vars):
+        if density:
+            sns.violinplot(x=cat, y=quant, data=data, ax=ax[0, i], hue=target, palette="Set2",
+                           inner=None)
+        else:
+            sns.swarmplot(x=cat, y=quant, data=data, ax=ax[0, i], hue=target, palette="Set2")
+        ax[0, i].set_xlabel('')
+        ax[0, i].set_ylabel(quant)
+        ax[0, i].set_title(cat)
+
+
+### Report
+
+def report_figures(target, cat_vars, quant_vars):
+    """
+    This function lists the figures `explore_univariate`, `explore_bivariate` and
+    `explore_multivariate` draw, one independent figure per entry.
+
+    :param target: the target variable
+    :param cat_vars: a list of categorical variables in the dataset
+    :param quant_vars: a list of quantitative variables in the dataset
+    :return: a list of (figure name, section, plot function name, extra arguments, columns used).
+    """
+    figures = []
+    for cat in cat_vars:
+        figures.append((f'univariate_{cat}', 'univariate', 'plot_univariate_categorical',
+                        (cat,), [cat]))
+    for quant in quant_vars:
+        figures.append((f'univariate_{quant}', 'univariate', 'explore_univariate_quant',
+                        (quant,), [quant]))
+    for cat in cat_vars:
+        figures.append((f'bivariate_{cat}', 'bivariate', 'plot_cat_by_target',
+                        (target, cat), [target, cat]))
+    for quant in quant_vars:
+        figures.append((f'bivariate_{quant}', 'bivariate', 'plot_bivariate_quant',
+                        (target, quant), [target, quant]))
+    if cat_vars:
+        for quant in quant_vars:
+            figures.append((f'swarm_{quant}', 'multivariate', 'plot_swarm_row',
+                            (target, list(cat_vars), quant), [target, *cat_vars, quant]))
+            figures.append((f'violin_{quant}', 'multivariate', 'plot_violin_row',
+                            (target, list(cat_vars), quant), [target, *cat_vars, quant]))
+    if quant_vars:
+        figures.append(('pairplot', 'multivariate', 'plot_pairplot',
+                        (target, list(quant_vars)), [target, *quant_vars]))
+        figures.append(('continuous_vars', 'multivariate', 'plot_continuous_boxen',
+                        (target, list(quant_vars)), [target, *quant_vars]))
+    return figures
+
+def figure_hash(column_hashes, function, args):
+    """
+    This function fingerprints one figure: the hashes of the columns it reads plus the plot function
+    and its arguments (and the large-data settings), so a figure is only redrawn when its own inputs
+    change.
+
+    :param column_hashes: a dict of column -> hex digest of the column's data
+    :param function: the plot function name
+    :param args: the plot function's extra arguments
+    :return: a hex digest string.
+    """
+    key = json.dumps([function, args, sorted(column_hashes.items()), POINT_BUDGET,
+                      LARGE_DATA_FALLBACK], default=str)
+    return hashlib.sha256(key.encode()).hexdigest()
+
+def _column_hashes(train, columns):
+    return {col: hashlib.sha256(pd.util.hash_pandas_object(train[col]).to_numpy().tobytes())
+            .hexdigest() for col in columns}
+
+def _init_report_worker(path, point_budget, large_data_fallback):
+    # spawned workers re-import this module, so the parent's large-data settings are passed in
+    global POINT_BUDGET, LARGE_DATA_FALLBACK
+    POINT_BUDGET, LARGE_DATA_FALLBACK = point_budget, large_data_fallback
+    plt.switch_backend('Agg')
+    _REPORT_DATA['train'] = pd.read_pickle(path)
+
+def _render_figure(name, function, args, directory, formats):
+    plt.close('all')
+    globals()[function](_REPORT_DATA['train'], *args)
+    fig = plt.gcf()
+    try:
+        for fmt in formats:
+            fig.savefig(os.path.join(directory, f'{name}.{fmt}'), format=fmt, bbox_inches='tight')
+    finally:
+        # close every figure as soon as it is written so worker memory stays flat
+        plt.close('all')
+    return name
+
+def write_report_index(directory, figures, formats):
+    """
+    This function writes the report's index.html: every figure grouped by section, shown as its
+    first format with links to the others.
+
+    :param directory: the report directory
+    :param figures: the list from `report_figures`
+    :param formats: the file formats written, e.g. ('png', 'svg')
+    :return: the path of index.html.
+    """
+    lines = ['<!DOCTYPE html>', '<html><head><meta charset="utf-8"><title>Exploration report</title>',
+             '</head><body>']
+    for section in dict.fromkeys(section for _, section, *_ in figures):
+        lines.append(f'<h2>{section.title()}</h2>')
+        for name, fig_section, *_ in figures:
+            if fig_section != section:
+                continue
+            links = ' '.join(f'<a href="{name}.{fmt}">{fmt}</a>' for fmt in formats)
+            lines.append(f'<figure><img src="{name}.{formats[0]}" alt="{name}">'
+                         f'<figcaption>{name} {links}</figcaption></figure>')
+    lines.append('</body></html>')
+    path = os.path.join(directory, 'index.html')
+    with open(path, 'w') as f:
+        f.write('\n'.join(lines))
+    return path
+
+@instrument.timed
+def render_report(train, target, cat_vars, quant_vars, directory='report', formats=('png', 'svg'),
+                  n_jobs=None, force=False):
+    """
+    The function renders every figure of the univariate, bivariate and multivariate exploration to
+    files instead of showing them: each figure is drawn with the Agg backend in a process pool,
+    saved in every format and closed, and an index.html links them all. Figures whose input columns
+    and arguments hash the same as in the last run are skipped.
+
+    :param train: a pandas DataFrame containing the training data
+    :param target: the target variable
+    :param cat_vars: a list of categorical variables in the dataset
+    :param quant_vars: a list of quantitative variables in the dataset
+    :param directory: where to write the figures, the index and the hash manifest, defaults to 'report'
+    :param formats: the file formats to write, defaults to ('png', 'svg') (optional)
+    :param n_jobs: the number of worker processes, defaults to the number of CPUs; 1 renders in this
+    process (optional)
+    :param force: redraw every figure even if its inputs are unchanged, defaults to False (optional)
+    :return: a DataFrame with figure, section and status ('rendered' or 'skipped').
+    """
+    os.makedirs(directory, exist_ok=True)
+    formats = tuple(formats)
+    figures = report_figures(target, cat_vars, quant_vars)
+    manifest_path = os.path.join(directory, 'manifest.json')
+    manifest = {}
+    if os.path.exists(manifest_path) and not force:
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+    column_hashes = _column_hashes(train, dict.fromkeys(c for *_, columns in figures for c in columns))
+    hashes, todo = {}, []
+    for name, section, function, args, columns in figures:
+        hashes[name] = figure_hash({c: column_hashes[c] for c in columns}, function, args)
+        written = all(os.path.exists(os.path.join(directory, f'{name}.{fmt}')) for fmt in formats)
+        if manifest.get(name) != hashes[name] or not written:
+            todo.append((name, function, args))
+
+    if todo:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'train.pkl')
+            train.to_pickle(path)
+            if n_jobs == 1:
+                backend = plt.get_backend()
+                _init_report_worker(path, POINT_BUDGET, LARGE_DATA_FALLBACK)
+                try:
+                    for task in todo:
+                        _render_figure(*task, directory, formats)
+                finally:
+                    plt.switch_backend(backend)
+            else:
+                with ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_report_worker,
+                                         initargs=(path, POINT_BUDGET, LARGE_DATA_FALLBACK)) as pool:
+                    futures = [pool.submit(_render_figure, *task, directory, formats) for task in todo]
+                    for future in futures:
+                        future.result()
+    _REPORT_DATA.clear()
+
+    with open(manifest_path, 'w') as f:
+        json.dump(hashes, f, indent=2)
+    write_report_index(directory, figures, formats)
+    rendered = {name for name, *_ in todo}
+    instrument.message(f'report: {len(rendered)} figures rendered, '
+                       f'{len(figures) - len(rendered)} unchanged -> {os.path.join(directory, "index.html")}')
+    return pd.DataFrame({'figure': [name for name, *_ in figures],
+                         'section': [section for _, section, *_ in figures],
+                         'status': ['rendered' if name in rendered else 'skipped'
+                                    for name, *_ in figures]})
@@ -0,0 +1,260 @@
+# imports
+import io
+import os
+import sys
+import json
+import time
+import logging
+import functools
+import threading
+
+# settings: progress messages are printed while VERBOSE is True; events are only built once a sink
+# is enabled, so with no sinks every hook is a single check
+VERBOSE = True
+_SINKS = []
+_PROFILE = ()
+_LOCAL = threading.local()
+
+# sinks: any callable taking an event dict
+class LoggingSink:
+    """
+    A sink that logs every event as one JSON line.
+
+    :param logger: the logger name, defaults to 'classification' (optional)
+    :param level: the logging level, defaults to logging.INFO (optional)
+    """
+    def __init__(self, logger='classification', level=logging.INFO):
+        self.logger = logging.getLogger(logger)
+        self.level = level
+
+    def __call__(self, event):
+        self.logger.log(self.level, json.dumps(event, default=str))
+
+class JsonLinesSink:
+    """
+    A sink that appends every event to a JSON lines file.
+
+    :param path: the file to append to
+    """
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def __call__(self, event):
+        line = json.dumps(event, default=str) + '\n'
+        with self._lock, open(self.path, 'a') as f:
+            f.write(line)
+
+class MemorySink:
+    """
+    A sink that keeps the events in a list, e.g. to inspect a notebook run with `frame()`.
+    """
+    def __init__(self):
+        self.events = []
+
+    def __call__(self, event):
+        self.events.append(event)
+
+    def frame(self):
+        """
+        This method returns the collected events as a DataFrame.
+        """
+        import pandas as pd
+        return pd.DataFrame(self.events)
+
+# functions
+def enable(*sinks, profile=()):
+    """
+    This function turns instrumentation on: every stage then emits an event to each sink.
+
+    :param sinks: the sinks to send events to, e.g. MemorySink() or JsonLinesSink('events.jsonl')
+    :param profile: per stage profilers to run, any of 'tracemalloc' (peak allocated bytes) and
+    'cprofile' (the stage's top functions by cumulative time), defaults to none (optional)
+    :return: the first sink, for convenience.
+    """
+    global _PROFILE
+    if isinstance(profile, str):
+        profile = (profile,)
+    unknown = set(profile) - {'tracemalloc', 'cprofile'}
+    if unknown:
+        raise ValueError(f'unknown profilers {sorted(unknown)}')
+    _SINKS[:] = sinks
+    _PROFILE = tuple(profile)
+    return sinks[0] if sinks else None
+
+def disable():
+    """
+    This function turns instrumentation off again.
+    """
+    global _PROFILE
+    _SINKS.clear()
+    _PROFILE = ()
+
+def enabled():
+    return bool(_SINKS)
+
+def emit(event):
+    """
+    This function sends an event to every sink.
+
+    :param event: a dict of JSON-serializable fields
+    """
+    for sink in _SINKS:
+        sink(event)
+
+def _max_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes elsewhere
+    return round(rss / 2**20 if sys.platform == 'darwin' else rss / 2**10, 1)
+
+class _NullStage:
+    def __enter__(self):
+        return {}
+
+    def __exit__(self, *exc):
+        return False
+
+_NULL_STAGE = _NullStage()
+
+class _Stage:
+    def __init__(self, name, fields):
+        self.event = {'stage': name, **fields}
+
+    def __enter__(self):
+        stack = _LOCAL.__dict__.setdefault('stack', [])
+        self.outermost = not stack
+        stack.append(self.event)
+        self.tracing = self.profiler = None
+        # profilers run for the outermost stage only, they cannot nest
+        if self.outermost and 'tracemalloc' in _PROFILE:
+            import tracemalloc
+            self.tracing = not tracemalloc.is_tracing()
+            if self.tracing:
+                tracemalloc.start()
+        if self.outermost and 'cprofile' in _PROFILE:
+            import cProfile
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        self.start = time.perf_counter()
+        return self.event
+
+    def __exit__(self, exc_type, exc, tb):
+        seconds = time.perf_counter() - self.start
+        if self.profiler is not None:
+            import pstats
+            self.profiler.disable()
+            out = io.StringIO()
+            pstats.Stats(self.profiler, stream=out).sort_stats('cumulative').print_stats(15)
+            self.event['profile'] = out.getvalue()
+        if self.tracing:
+            import tracemalloc
+            self.event['peak_bytes'] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        _LOCAL.stack.pop()
+        self.event.update(seconds=round(seconds, 6), max_rss_mb=_max_rss_mb(), pid=os.getpid(),
+                          timestamp=time.time(), error=None if exc_type is None else exc_type.__name__)
+        emit(self.event)
+        return False
+
+def stage(name, **fields):
+    """
+    This function times a block of work as one stage:
+
+        with instrument.stage('get_data', dataset=name) as event:
+            ...
+            event['cache'] = 'hit'
+
+    On exit the event gets the wall time, the process's peak RSS and, when enabled, the stage's
+    peak traced allocation and cProfile summary, and is sent to the sinks. With instrumentation
+    disabled it returns a shared no-op context whose event dict is discarded.
+
+    :param name: the stage name
+    :param fields: initial event fields, e.g. dataset, rows, columns
+    :return: a context manager yielding the event dict.
+    """
+    if not _SINKS:
+        return _NULL_STAGE
+    return _Stage(name, fields)
+
+def message(text):
+    """
+    This function reports a progress message: it is printed while VERBOSE is True and added to the
+    messages of the current stage's event when instrumentation is enabled.
+
+    :param text: the message
+    """
+    if VERBOSE:
+        print(text)
+    stack = getattr(_LOCAL, 'stack', None)
+    if stack:
+        stack[-1].setdefault('messages', []).append(text)
+
+def _shape(value):
+    if isinstance(value, tuple) and value:
+        value = value[0]
+    shape = getattr(value, 'shape', None)
+    return shape if shape is not None and len(shape) == 2 else None
+
+def timed(func):
+    """
+    This decorator runs a function as a stage named after it, recording the rows and columns of its
+    first dataframe argument and of its (first) returned dataframe.
+
+    :param func: the function to instrument
+    :return: the wrapped function; it calls func directly while instrumentation is disabled.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not _SINKS:
+            return func(*args, **kwargs)
+        with _Stage(func.__name__, {}) as event:
+            shape = _shape(args[0]) if args else None
+            if shape is not None:
+                event['rows'], event['columns'] = shape
+            result = func(*args, **kwargs)
+            shape = _shape(result)
+            if shape is not None:
+                event['rows_out'], event['columns_out'] = shape
+            return result
+    return wrapper
+
+def timed_chunks(name, chunks, event=None):
+    """
+    This function instruments a stream of dataframe chunks as one stage: the event records the time
+    spent producing chunks (not the consumer's time between them), the number of chunks and rows,
+    and is emitted once the stream ends or is abandoned.
+
+    :param name: the stage name
+    :param chunks: an iterable of dataframes
+    :param event: a dict of event fields the producer may fill in while streaming (optional)
+    :return: the chunks, unchanged while instrumentation is disabled.
+    """
+    if not _SINKS:
+        return chunks
+    return _timed_chunks(name, iter(chunks), {} if event is None else event)
+
+def _timed_chunks(name, chunks, event):
+    seconds, rows, count, error = 0.0, 0, 0, None
+    try:
+        while True:
+            start = time.perf_counter()
+            try:
+                chunk = next(chunks)
+            except StopIteration:
+                break
+            except Exception as e:
+                error = type(e).__name__
+                raise
+            finally:
+                seconds += time.perf_counter() - start
+            rows += len(chunk)
+            count += 1
+            yield chunk
+    finally:
+        emit({'stage': name, **event, 'rows': rows, 'chunks': count, 'seconds': round(seconds, 6),
+              'max_rss_mb': _max_rss_mb(), 'pid': os.getpid(), 'timestamp': time.time(),
+              'error': error})
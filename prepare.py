@@ -1,22 +1,376 @@
 # imports
 import pandas as pd
-from sklearn.model_selection import train_test_split
-from sklearn.impute import SimpleImputer
+import numpy as np
+import os
+import json
+import hashlib
+import tempfile
+import instrument
+
+# split indices are cached here, see split_indices
+SPLIT_CACHE_DIR = 'split_cache'
+
+# partitioned prep: partitions are at least this many rows, so small frames stay in one process
+PARTITION_ROWS = 100_000
+# worker state: the fitted pipeline (and, under fork, the frame) shared with each worker process
+_PREP_WORKER = {}
+
+# inputs: the raw columns (and row filters) each prep function reads, so acquisition can push the
+# projection down into the SQL query and cache read, e.g.
+# acquire.get_titanic_data(**prep_inputs(prep_titanic_drp_null_age))
+IRIS_COLUMNS = ['species_name','sepal_length','sepal_width','petal_length','petal_width']
+TITANIC_COLUMNS = ['survived','pclass','sex','age','sibsp','parch','fare','embarked','alone']
+TELCO_COLUMNS = ['gender','senior_citizen','partner','dependents','tenure','phone_service',
+                 'multiple_lines','online_security','online_backup','device_protection',
+                 'tech_support','streaming_tv','streaming_movies','paperless_billing',
+                 'monthly_charges','total_charges','churn','contract_type',
+                 'internet_service_type','payment_type']
+PREP_INPUTS = {
+    'prep_iris': {'columns': IRIS_COLUMNS},
+    'prep_split_iris': {'columns': IRIS_COLUMNS},
+    'prep_titanic_drp_age': {'columns': [c for c in TITANIC_COLUMNS if c != 'age']},
+    'prep_split_titanic_drp_age': {'columns': [c for c in TITANIC_COLUMNS if c != 'age']},
+    'prep_split_titanic_imp_age': {'columns': TITANIC_COLUMNS},
+    'prep_titanic_drp_null_age': {'columns': TITANIC_COLUMNS, 'filters': [('age', 'not null', None)]},
+    'prep_split_titanic_drp_null_age': {'columns': TITANIC_COLUMNS,
+                                        'filters': [('age', 'not null', None)]},
+    'prep_telco': {'columns': TELCO_COLUMNS},
+    'prep_split_telco': {'columns': TELCO_COLUMNS},
+}
+
+# pipelines: declarative cleaning specs for each dataset, see PrepPipeline
+IRIS_PREP = {
+    'drop': ['species_id','measurement_id'],
+    'rename': {'species_name':'species'},
+}
+TITANIC_DRP_AGE_PREP = {
+    'drop': ['age','class','deck','embark_town','passenger_id'],
+    'fill': {'embarked': 'S'},
+    'dummies': ['sex','embarked'],
+}
+TITANIC_IMP_AGE_PREP = {
+    'drop': ['class','deck','embark_town','passenger_id'],
+    'fill': {'embarked': 'S'},
+    'impute': ['age'],
+    'dummies': ['sex','embarked'],
+}
+TITANIC_DRP_NULL_AGE_PREP = {
+    'drop': ['class','deck','embark_town','passenger_id'],
+    'fill': {'embarked': 'S'},
+    'dropna': True,
+    'dummies': ['sex','embarked'],
+}
+YES_NO = {'Yes': 1, 'No': 0}
+TELCO_PREP = {
+    'drop': ['customer_id','payment_type_id','internet_service_type_id','contract_type_id'],
+    'blank_to_number': {'total_charges': 0},
+    'binary': {
+        'Female': ['gender', {'Female': 1, 'Male': 0}],
+        'partnered': ['partner', YES_NO],
+        'has_dependents': ['dependents', YES_NO],
+        'has_phone_service': ['phone_service', YES_NO],
+        'does_paperless_billing': ['paperless_billing', YES_NO],
+        'churned': ['churn', YES_NO],
+    },
+    'dummies': ['multiple_lines','online_security','online_backup','device_protection',
+                'tech_support','streaming_tv','streaming_movies','contract_type',
+                'internet_service_type','payment_type'],
+}
+
+class PrepPipeline:
+    """
+    A declarative cleaning pipeline: `fit` learns the dummy vocabularies and imputation values from
+    the train split, `transform` applies exactly the same cleaning to any frame in one pass over the
+    columns, building the output frame once instead of through drop/get_dummies/concat copies.
+    A fitted pipeline can be saved to JSON and loaded for scoring without refitting.
+
+    Steps, applied per column in this order:
+    drop            columns to drop
+    fill            {column: value} constant fills for missing values
+    blank_to_number {column: value} blank strings (' ') become value, then the column is float
+    impute          columns whose missing values become the train mean
+    dropna          drop rows that still have missing values
+    rename          {old name: new name}
+    binary          {new column: [source column, {value: code}]} mapped flags
+    dummies         columns one-hot encoded against the fitted vocabulary, first category dropped
+
+    compact=True stores the remaining string columns as `category` dtype and derives the binary
+    flags (bool) and dummies (bool) from the category codes instead of separate maps; values outside
+    the fitted vocabulary become missing / False. drop_original=True leaves out the source columns
+    of the binary flags and dummies. dummy_dtype sets the dtype of the dummy columns, bool like
+    `pd.get_dummies` by default (e.g. 'uint8' for libraries that want numbers).
+    """
+
+    def __init__(self, drop=(), fill=None, blank_to_number=None, impute=(), dropna=False,
+                 rename=None, binary=None, dummies=(), compact=False, drop_original=False,
+                 dummy_dtype='bool'):
+        self.drop = list(drop)
+        self.fill = dict(fill or {})
+        self.blank_to_number = dict(blank_to_number or {})
+        self.impute = list(impute)
+        self.dropna = dropna
+        self.rename = dict(rename or {})
+        self.binary = {k: list(v) for k, v in (binary or {}).items()}
+        self.dummies = list(dummies)
+        self.compact = compact
+        self.drop_original = drop_original
+        self.dummy_dtype = dummy_dtype
+        self.vocabulary_ = None
+        self.means_ = None
+        self.numeric_ = None
+
+    def _column(self, df, column):
+        s = df[column]
+        if column in self.fill:
+            s = s.fillna(self.fill[column])
+        if column in self.blank_to_number:
+            s = s.where(s != ' ', self.blank_to_number[column]).astype(float)
+        return s
+
+    def filter_rows(self, df):
+        """
+        This method drops the rows the pipeline's dropna step would drop. It needs no fitting.
+
+        :param df: the raw input dataframe
+        :return: df without the dropped rows.
+        """
+        if not self.dropna:
+            return df
+        mask = np.ones(len(df), dtype=bool)
+        for column in df.columns:
+            if column not in self.drop and column not in self.impute:
+                mask &= self._column(df, column).notna().to_numpy()
+        return df if mask.all() else df[mask]
+
+    def fit(self, df):
+        """
+        This method learns the dummy vocabularies (sorted categories, like `pd.get_dummies`) and the
+        imputation means from a train frame.
+
+        :param df: the raw train dataframe
+        :return: the fitted pipeline.
+        """
+        df = self.filter_rows(df)
+        self.vocabulary_ = {c: pd.Categorical(self._column(df, c).dropna()).categories.tolist()
+                            for c in self.dummies}
+        self.means_ = {c: float(self._column(df, c).mean()) for c in self.impute}
+        # numeric kept columns, in output order, for the fixed-width feature matrix
+        self.numeric_ = [c for c in df.columns
+                         if c not in self.drop and c not in self.dummies
+                         and c not in {source for source, _ in self.binary.values()}
+                         and (pd.api.types.is_numeric_dtype(self._column(df, c).dtype))]
+        return self
+
+    def partition_stats(self, df):
+        """
+        This method computes the mergeable part of `fit` on one row partition: the distinct values of
+        each dummy column and the sum and count of each imputed column, after the dropna step.
+
+        :param df: a raw row partition
+        :return: a dict of 'levels' {column: list of values} and 'sums' {column: [sum, count]}.
+        """
+        df = self.filter_rows(df)
+        return {'levels': {c: self._column(df, c).dropna().unique().tolist() for c in self.dummies},
+                'sums': {c: [float(self._column(df, c).sum()), int(self._column(df, c).count())]
+                         for c in self.impute}}
+
+    def fit_stats(self, stats, df):
+        """
+        This method fits the pipeline from the `partition_stats` of every partition, so the
+        vocabularies and means can be learned in parallel; the result matches `fit` on the whole
+        frame (up to float rounding of the means).
+
+        :param stats: a list of `partition_stats` dicts
+        :param df: any raw frame with the train columns and dtypes, e.g. the first partition
+        :return: the fitted pipeline.
+        """
+        self.fit(df.iloc[:0])
+        self.vocabulary_ = {c: sorted(set().union(*(s['levels'][c] for s in stats)))
+                            for c in self.dummies}
+        total = {c: np.sum([s['sums'][c] for s in stats], axis=0) for c in self.impute}
+        self.means_ = {c: float(total[c][0] / total[c][1]) if total[c][1] else float('nan')
+                       for c in self.impute}
+        return self
+
+    @property
+    def feature_names_(self):
+        """
+        The column names of the matrices returned by `transform_array`, in order: the numeric kept
+        columns, the binary flags, then the dummies.
+        """
+        return ([self.rename.get(c, c) for c in self.numeric_] + list(self.binary)
+                + [f'{c}_{v}' for c, vocabulary in self.vocabulary_.items() for v in vocabulary[1:]])
+
+    def transform_array(self, batch, dtype=np.float64):
+        """
+        This method encodes a batch of raw rows straight into a fixed-width NumPy feature matrix,
+        skipping the intermediate dataframe. The columns are always `feature_names_`, whatever
+        categories the batch contains; unknown binary values and missing numbers become NaN, and
+        the dropna step is not applied so every input row gets an output row.
+
+        :param batch: a pandas DataFrame or a list of dict records with the raw columns
+        :param dtype: the NumPy dtype of the matrix, defaults to float64 (optional)
+        :return: a NumPy array of shape (rows, len(feature_names_)).
+        """
+        if self.vocabulary_ is None:
+            raise ValueError('PrepPipeline is not fitted, call fit first')
+        if not isinstance(batch, pd.DataFrame):
+            # only pull the columns the features need out of the records
+            records = list(batch)
+            needed = self.numeric_ + [source for source, _ in self.binary.values()] + self.dummies
+            batch = pd.DataFrame({c: [r.get(c) for r in records] for c in dict.fromkeys(needed)})
+        out = np.empty((len(batch), len(self.feature_names_)), dtype=dtype)
+        j = 0
+        for column in self.numeric_:
+            s = self._column(batch, column)
+            if column in self.means_:
+                s = s.fillna(self.means_[column])
+            out[:, j] = pd.to_numeric(s, errors='coerce')
+            j += 1
+        for source, mapping in self.binary.values():
+            lookup = np.array(list(mapping.values()) + [np.nan], dtype=dtype)
+            codes = pd.Index(list(mapping)).get_indexer(self._column(batch, source))
+            out[:, j] = lookup[codes]
+            j += 1
+        for column, vocabulary in self.vocabulary_.items():
+            codes = pd.Index(vocabulary).get_indexer(self._column(batch, column))
+            width = len(vocabulary) - 1
+            out[:, j:j + width] = codes[:, None] == np.arange(1, len(vocabulary))
+            j += width
+        return out
+
+    def transform_batches(self, batches, dtype=np.float64):
+        """
+        This method encodes a stream of raw row batches, e.g. `acquire.stream_data` chunks or lists
+        of dict records from a scoring service, with `transform_array`.
+
+        :param batches: an iterable of pandas DataFrames or lists of dict records
+        :param dtype: the NumPy dtype of the matrices, defaults to float64 (optional)
+        :return: a generator of NumPy arrays whose columns are `feature_names_`.
+        """
+        for batch in batches:
+            yield self.transform_array(batch, dtype)
+
+    def transform(self, df):
+        """
+        This method cleans and encodes a frame with the fitted vocabularies and means. The output
+        always has the same columns, even when a category is missing from df.
+
+        :param df: a raw dataframe with the same columns as the train frame
+        :return: the cleaned and prepped dataframe.
+        """
+        if self.vocabulary_ is None:
+            raise ValueError('PrepPipeline is not fitted, call fit first')
+        df = self.filter_rows(df)
+        encoded = set(self.dummies) | {source for source, _ in self.binary.values()}
+        categories = dict(self.vocabulary_)
+        for source, mapping in self.binary.values():
+            categories.setdefault(source, list(mapping))
+        categoricals = {}
+        def categorical(column):
+            if column not in categoricals:
+                categoricals[column] = pd.Categorical(self._column(df, column),
+                                                      categories=categories[column])
+            return categoricals[column]
+        columns = {}
+        for column in df.columns:
+            if column in self.drop or (self.drop_original and column in encoded):
+                continue
+            s = self._column(df, column)
+            if column in self.means_:
+                s = s.fillna(self.means_[column])
+            if self.compact and (s.dtype == object or pd.api.types.is_string_dtype(s.dtype)):
+                s = (pd.Series(categorical(column), index=df.index) if column in categories
+                     else s.astype('category'))
+            columns[self.rename.get(column, column)] = s
+        for new_column, (source, mapping) in self.binary.items():
+            if self.compact:
+                codes = categorical(source).codes
+                lookup = np.array([bool(mapping[value]) for value in categories[source]])
+                columns[new_column] = (codes >= 0) & lookup[codes]
+            else:
+                columns[new_column] = self._column(df, source).map(mapping)
+        dtype = np.dtype(self.dummy_dtype)
+        for column, vocabulary in self.vocabulary_.items():
+            # one vectorized compare of the category codes against every kept category
+            onehot = categorical(column).codes[:, None] == np.arange(1, len(vocabulary))
+            for j, value in enumerate(vocabulary[1:]):
+                columns[f'{column}_{value}'] = onehot[:, j].astype(dtype, copy=False)
+        return pd.DataFrame(columns, index=df.index)
+
+    def fit_transform(self, df):
+        """
+        This method fits the pipeline on df and transforms it.
+
+        :param df: the raw train dataframe
+        :return: the cleaned and prepped dataframe.
+        """
+        return self.fit(df).transform(df)
+
+    def to_dict(self):
+        """
+        This method returns the pipeline's spec and fitted state as plain JSON-serialisable data.
+        """
+        return {'drop': self.drop, 'fill': self.fill, 'blank_to_number': self.blank_to_number,
+                'impute': self.impute, 'dropna': self.dropna, 'rename': self.rename,
+                'binary': self.binary, 'dummies': self.dummies, 'compact': self.compact,
+                'drop_original': self.drop_original, 'dummy_dtype': self.dummy_dtype,
+                'vocabulary_': self.vocabulary_,
+                'means_': self.means_, 'numeric_': self.numeric_}
+
+    @classmethod
+    def from_dict(cls, state):
+        """
+        This method rebuilds a pipeline, fitted or not, from `to_dict` output.
+        """
+        state = dict(state)
+        fitted = {k: state.pop(k, None) for k in ['vocabulary_', 'means_', 'numeric_']}
+        pipeline = cls(**state)
+        pipeline.__dict__.update(fitted)
+        return pipeline
+
+    def save(self, filename):
+        """
+        This method saves the pipeline to a JSON file.
+
+        :param filename: path of the JSON file to write
+        """
+        with open(filename, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    @classmethod
+    def load(cls, filename):
+        """
+        This method loads a pipeline saved with `save`.
+
+        :param filename: path of the JSON file to read
+        :return: the PrepPipeline, fitted if it was fitted when saved.
+        """
+        with open(filename) as f:
+            return cls.from_dict(json.load(f))
 
 # functions
+def prep_inputs(prep):
+    """
+    This function looks up the raw columns and row filters a prep function needs.
+
+    :param prep: a prep function from this module, e.g. `prep_telco`, or its name
+    :return: a dict with 'columns' (and 'filters' where rows can be dropped early) to pass to the
+    acquire loaders, e.g. `acquire.get_telco_data(**prep_inputs(prep_telco))`.
+    """
+    return PREP_INPUTS[getattr(prep, '__name__', prep)]
+
+@instrument.timed
 def prep_iris(df):
     """
-    This function prepares the iris dataset by cleaning it, creating dummy variables for the species
-    column, and splitting it into train, validate, and test sets.
+    This function prepares the iris dataset by dropping the id columns and renaming the species
+    column.
     
-    :param iris: The input dataset containing information about the iris flowers
-    :return: The function `prep_iris` is returning three dataframes: `train`, `validate`, and `test`.
-    These dataframes are the result of cleaning and splitting the original `iris` dataframe.
-    """
-    # clean
-    df = df.drop(columns=['species_id','measurement_id'])
-    df = df.rename(columns={'species_name':'species'})
-    print('data cleaned and prepped')
+    :param df: The input dataset containing information about the iris flowers
+    :return: a cleaned and prepped dataframe.
+    """
+    df = PrepPipeline(**IRIS_PREP).fit_transform(df)
+    instrument.message('data cleaned and prepped')
     return df
 
 def prep_split_iris(df, test=.2, validate=.25):
@@ -27,22 +381,10 @@ def prep_split_iris(df, test=.2, validate=.25):
     :param df: The input dataframe containing the Iris dataset
     :return: three dataframes: train, validate, and test.
     """
-    # clean
-    df = df.drop(columns=['species_id','measurement_id'])
-    df = df.rename(columns={'species_name':'species'})
-    print('data cleaned and prepped')
-    print('data split')
-    train_validate, test = train_test_split(df, test_size=test, random_state=42, stratify=df['species'])
-    train, validate = train_test_split(train_validate, 
-                                        test_size=validate, 
-                                        random_state=42, 
-                                        stratify=train_validate['species'])
-    print(f'train -> {train.shape}; {round(len(train)*100/len(df),2)}%')
-    print(f'validate -> {validate.shape}; {round(len(validate)*100/len(df),2)}%')
-    print(f'test -> {test.shape}; {round(len(test)*100/len(df),2)}%')
-    return train, validate, test
+    return prep_split(df, PrepPipeline(**IRIS_PREP), 'species_name', test, validate)
 
-def prep_titanic_drp_age(df):
+@instrument.timed
+def prep_titanic_drp_age(df, n_jobs=1):
     """
     The function preps a Titanic dataset by dropping certain columns, filling missing values, creating
     dummy variables, and returning the cleaned dataset.
@@ -50,14 +392,11 @@ def prep_titanic_drp_age(df):
     :param df: a pandas DataFrame containing the Titanic dataset with columns for age, class, deck,
     embark_town, passenger_id, sex, embarked, and other variables. The function `prep_titanic` takes
     this DataFrame as input and performs some data cleaning and preparation steps on it
+    :param n_jobs: worker processes for large frames, see `prep_partitioned`, defaults to 1 (optional)
     :return: a cleaned and prepped dataframe.
     """
-    # clean
-    df = df.drop(columns=['age','class','deck','embark_town','passenger_id'])
-    df['embarked'] = df.embarked.fillna(value='S')
-    dummy_df = pd.get_dummies(df[['sex','embarked']], dummy_na=False, drop_first=True)
-    df = pd.concat([df, dummy_df], axis=1)
-    print('data cleaned and prepped')
+    df = prep_partitioned(df, PrepPipeline(**TITANIC_DRP_AGE_PREP), n_jobs)
+    instrument.message('data cleaned and prepped')
     return df
 
 def prep_split_titanic_drp_age(df, test=.2, validate=.25):
@@ -67,179 +406,232 @@ def prep_split_titanic_drp_age(df, test=.2, validate=.25):
     :param df: The input dataframe containing the Titanic dataset
     :return: three dataframes: train, validate, and test.
     """
-    # clean
-    df = df.drop(columns=['age','class','deck','embark_town','passenger_id'])
-    df['embarked'] = df.embarked.fillna(value='S')
-    dummy_df = pd.get_dummies(df[['sex','embarked']], dummy_na=False, drop_first=True)
-    df = pd.concat([df, dummy_df], axis=1)
-    print('data cleaned and prepped')
-    print('data split')
-    train_validate, test = train_test_split(df, test_size=test, random_state=42, stratify=df['survived'])
-    train, validate = train_test_split(train_validate, 
-                                        test_size=validate, 
-                                        random_state=42, 
-                                        stratify=train_validate['survived'])
-    print(f'train -> {train.shape}; {round(len(train)*100/len(df),2)}%')
-    print(f'validate -> {validate.shape}; {round(len(validate)*100/len(df),2)}%')
-    print(f'test -> {test.shape}; {round(len(test)*100/len(df),2)}%')
-    return train, validate, test
-
-# def prep_titanic_imp_age(df): # can't impute before split as mean age is influenced by val and test data
-#     """
-#     This function prepares the Titanic dataset by cleaning and prepping the data, including dropping
-#     unnecessary columns, filling missing values, creating dummy variables, and imputing missing age
-#     values with the mean.
-    
-#     :param df: The input dataframe that contains information about passengers on the Titanic
-#     :return: a cleaned and prepped dataframe with the 'age' column imputed using the mean strategy.
-#     """
-#     # clean
-#     df = df.drop(columns=['class','deck','embark_town','passenger_id'])
-#     df['embarked'] = df.embarked.fillna(value='S')
-#     dummy_df = pd.get_dummies(df[['sex','embarked']], dummy_na=False, drop_first=True)
-#     df = pd.concat([df, dummy_df], axis=1)
-#     print('data cleaned and prepped')
-#     imputer = SimpleImputer(strategy = 'mean')
-#     df['age'] = imputer.fit_transform(df[['age']])
-#     return df
+    return prep_split(df, PrepPipeline(**TITANIC_DRP_AGE_PREP), 'survived', test, validate)
 
 def prep_split_titanic_imp_age(df, test=.2, validate=.25):
     """
     This function prepares the Titanic dataset by cleaning and prepping the data, including dropping
     unnecessary columns, filling missing values, creating dummy variables, and imputing missing age
-    values with the mean.
+    values with the mean age of the train split (validate and test never influence it).
     
     :param df: The input dataframe that contains information about passengers on the Titanic
-    :return: a cleaned and prepped dataframe with the 'age' column imputed using the mean strategy.
-    """
-    # clean
-    df = df.drop(columns=['class','deck','embark_town','passenger_id'])
-    df['embarked'] = df.embarked.fillna(value='S')
-    dummy_df = pd.get_dummies(df[['sex','embarked']], dummy_na=False, drop_first=True)
-    df = pd.concat([df, dummy_df], axis=1)
-    print('data cleaned and prepped')
-    print('data split')
-    train_validate, test = train_test_split(df, test_size=test, random_state=42, stratify=df['survived'])
-    train, validate = train_test_split(train_validate, 
-                                        test_size=validate, 
-                                        random_state=42, 
-                                        stratify=train_validate['survived'])
-    imputer = SimpleImputer(strategy = 'mean')
-    train['age'] = imputer.fit_transform(train[['age']])
-    validate['age'] = imputer.fit_transform(validate[['age']])
-    test['age'] = imputer.fit_transform(test[['age']])
-    print(f'train -> {train.shape}; {round(len(train)*100/len(df),2)}%')
-    print(f'validate -> {validate.shape}; {round(len(validate)*100/len(df),2)}%')
-    print(f'test -> {test.shape}; {round(len(test)*100/len(df),2)}%')
-    return train, validate, test
+    :return: three dataframes: train, validate, and test.
+    """
+    return prep_split(df, PrepPipeline(**TITANIC_IMP_AGE_PREP), 'survived', test, validate)
 
-def prep_titanic_drp_null_age(df):
+@instrument.timed
+def prep_titanic_drp_null_age(df, n_jobs=1):
     """
     The function drops certain columns, fills missing values in 'embarked' column, drops rows with
     missing values, creates dummy variables for 'sex' and 'embarked' columns, and returns the cleaned
     and prepped dataframe.
     
     :param df: The parameter `df` is a Pandas DataFrame containing the Titanic dataset
+    :param n_jobs: worker processes for large frames, see `prep_partitioned`, defaults to 1 (optional)
     :return: a cleaned and prepped dataframe with dropped columns, filled null values, and dummy
     variables created for 'sex' and 'embarked' columns.
     """
-    # clean
-    df = df.drop(columns=['class','deck','embark_town','passenger_id'])
-    df['embarked'] = df.embarked.fillna(value='S')
-    df = df.dropna()
-    dummy_df = pd.get_dummies(df[['sex','embarked']], dummy_na=False, drop_first=True)
-    df = pd.concat([df, dummy_df], axis=1)
-    print('data cleaned and prepped')
+    df = prep_partitioned(df, PrepPipeline(**TITANIC_DRP_NULL_AGE_PREP), n_jobs)
+    instrument.message('data cleaned and prepped')
     return df
 
 def prep_split_titanic_drp_null_age(df, test=.2, validate=.25):
     """
     The function drops certain columns, fills missing values in 'embarked' column, drops rows with
-    missing values, creates dummy variables for 'sex' and 'embarked' columns, and returns the cleaned
-    and prepped dataframe.
+    missing values, creates dummy variables for 'sex' and 'embarked' columns, and splits the result
+    into train, validate, and test sets.
     
     :param df: The parameter `df` is a Pandas DataFrame containing the Titanic dataset
-    :return: a cleaned and prepped dataframe with dropped columns, filled null values, and dummy
-    variables created for 'sex' and 'embarked' columns.
+    :return: three dataframes: train, validate, and test.
     """
-    # clean
-    df = df.drop(columns=['class','deck','embark_town','passenger_id'])
-    df['embarked'] = df.embarked.fillna(value='S')
-    df = df.dropna()
-    dummy_df = pd.get_dummies(df[['sex','embarked']], dummy_na=False, drop_first=True)
-    df = pd.concat([df, dummy_df], axis=1)
-    print('data cleaned and prepped')
-    print('data split')
-    train_validate, test = train_test_split(df, test_size=test, random_state=42, stratify=df['survived'])
-    train, validate = train_test_split(train_validate, 
-                                        test_size=validate, 
-                                        random_state=42, 
-                                        stratify=train_validate['survived'])
-    print(f'train -> {train.shape}; {round(len(train)*100/len(df),2)}%')
-    print(f'validate -> {validate.shape}; {round(len(validate)*100/len(df),2)}%')
-    print(f'test -> {test.shape}; {round(len(test)*100/len(df),2)}%')
-    return train, validate, test
+    return prep_split(df, PrepPipeline(**TITANIC_DRP_NULL_AGE_PREP), 'survived', test, validate)
 
-def prep_telco(df):
+@instrument.timed
+def prep_telco(df, compact=False, drop_original=False, n_jobs=1):
     """
     The function takes a dataframe and performs data cleaning and preparation by dropping unnecessary
     columns, converting data types, creating dummy variables, and mapping categorical variables to
     binary values.
     
     :param df: a pandas DataFrame containing Telco customer data
+    :param compact: store string columns as category and flags/dummies as bool, and report the
+    memory use before and after, defaults to False (optional)
+    :param drop_original: leave out the string columns the flags and dummies were made from,
+    defaults to False (optional)
+    :param n_jobs: worker processes for large frames, see `prep_partitioned`, defaults to 1 (optional)
     :return: a cleaned and preprocessed dataframe.
     """
-    # clean
-    df = df.drop(columns=['customer_id','payment_type_id','internet_service_type_id','contract_type_id'])
-    df.loc[df.total_charges==' ','total_charges']=0
-    df.total_charges = df.total_charges.astype(float)
-    df['Female'] = df.gender.map({'Female': 1, 'Male': 0})
-    df['partnered'] = df.partner.map({'Yes': 1, 'No': 0})
-    df['has_dependents'] = df.dependents.map({'Yes': 1, 'No': 0})
-    df['has_phone_service'] = df.phone_service.map({'Yes': 1, 'No': 0})
-    df['does_paperless_billing'] = df.paperless_billing.map({'Yes': 1, 'No': 0})
-    df['churned'] = df.churn.map({'Yes': 1, 'No': 0})
-    dummy_df = pd.get_dummies(df[['multiple_lines','online_security','online_backup','device_protection','tech_support','streaming_tv','streaming_movies','contract_type','internet_service_type','payment_type']], dummy_na=False, drop_first=True)
-    df = pd.concat([df, dummy_df], axis=1)
-    print('data cleaned and prepped')
-    return df
+    pipeline = PrepPipeline(**TELCO_PREP, compact=compact, drop_original=drop_original)
+    prepped = prep_partitioned(df, pipeline, n_jobs)
+    instrument.message('data cleaned and prepped')
+    if compact:
+        instrument.message(f'memory -> {memory_mb(df)} MB before; {memory_mb(prepped)} MB after')
+    return prepped
 
-def prep_split_telco(df, test=.2, validate=.25):
+def prep_split_telco(df, test=.2, validate=.25, compact=False, drop_original=False):
     """
     This function prepares and splits a Telco customer dataset into training, validation, and testing
     sets.
     
     :param df: The input dataframe that contains the Telco customer data
+    :param compact: see `prep_telco`, defaults to False (optional)
+    :param drop_original: see `prep_telco`, defaults to False (optional)
+    :return: three dataframes: train, validate, and test.
+    """
+    pipeline = PrepPipeline(**TELCO_PREP, compact=compact, drop_original=drop_original)
+    return prep_split(df, pipeline, 'churn', test, validate)
+
+def memory_mb(df):
+    """
+    This function measures the memory a dataframe uses, including the contents of string columns.
+
+    :param df: a pandas DataFrame
+    :return: the memory use in megabytes, rounded to 2 decimals.
+    """
+    return round(df.memory_usage(index=True, deep=True).sum() / 2**20, 2)
+
+@instrument.timed
+def prep_split(df, pipeline, strat, test=.2, validate=.25):
+    """
+    This function drops the rows the pipeline filters out, splits the raw data, fits the pipeline on
+    the train split only and transforms all three splits with it.
+    
+    :param df: the raw input dataframe
+    :param pipeline: an unfitted `PrepPipeline`; it is fitted in place, so it can be saved afterwards
+    and reused to score new data with exactly the same transform
+    :param strat: the raw column to stratify the split on
+    :param test: The proportion of the data that should be allocated to the test set
+    :param validate: The proportion of the remaining data that should be allocated to validate
     :return: three dataframes: train, validate, and test.
     """
-    # clean
-    df = df.drop(columns=['customer_id','payment_type_id','internet_service_type_id','contract_type_id'])
-    df.loc[df.total_charges==' ','total_charges']=0
-    df.total_charges = df.total_charges.astype(float)
-    df['Female'] = df.gender.map({'Female': 1, 'Male': 0})
-    df['partnered'] = df.partner.map({'Yes': 1, 'No': 0})
-    df['has_dependents'] = df.dependents.map({'Yes': 1, 'No': 0})
-    df['has_phone_service'] = df.phone_service.map({'Yes': 1, 'No': 0})
-    df['does_paperless_billing'] = df.paperless_billing.map({'Yes': 1, 'No': 0})
-    df['churned'] = df.churn.map({'Yes': 1, 'No': 0})
-    dummy_df = pd.get_dummies(df[['multiple_lines','online_security','online_backup','device_protection','tech_support','streaming_tv','streaming_movies','contract_type','internet_service_type','payment_type']], dummy_na=False, drop_first=True)
-    df = pd.concat([df, dummy_df], axis=1)
-    print('data cleaned and prepped')
-    print('data split')
-    train_validate, test = train_test_split(df, test_size=test, random_state=42, stratify=df['churn'])
-    train, validate = train_test_split(train_validate, 
-                                        test_size=validate, 
-                                        random_state=42, 
-                                        stratify=train_validate['churn'])
-    print(f'train -> {train.shape}; {round(len(train)*100/len(df),2)}%')
-    print(f'validate -> {validate.shape}; {round(len(validate)*100/len(df),2)}%')
-    print(f'test -> {test.shape}; {round(len(test)*100/len(df),2)}%')
+    train, validate, test = split_data(pipeline.filter_rows(df), strat, test, validate)
+    pipeline.fit(train)
+    train, validate, test = [pipeline.transform(split) for split in (train, validate, test)]
+    instrument.message('data cleaned and prepped')
     return train, validate, test
 
-def split_data(df, strat, test=.2, validate=.25):
+def prep_chunks(chunks, prep):
+    """
+    This function applies a prep function to each chunk of a chunked dataset, e.g. the generator
+    returned by `acquire.stream_data`, without ever holding the whole dataset in memory.
+
+    :param chunks: an iterable of pandas DataFrames
+    :param prep: the function that prepares one chunk, e.g. `prep_iris`. Functions that build dummy
+    columns only give matching columns when every chunk contains every category (`prep_partitioned`
+    with a fitted pipeline always does)
+    :return: a generator of prepared pandas DataFrames.
+    """
+    for chunk in chunks:
+        yield prep(chunk)
+
+def partition_bounds(rows, partitions):
+    """
+    This function cuts a frame's rows into contiguous, near-equal partitions.
+
+    :param rows: the number of rows
+    :param partitions: the number of partitions
+    :return: a list of (start, stop) positional bounds, without empty partitions.
+    """
+    edges = np.linspace(0, rows, max(1, partitions) + 1).astype(np.int64)
+    return [(int(a), int(b)) for a, b in zip(edges[:-1], edges[1:]) if b > a]
+
+def _init_prep_worker(state):
+    _PREP_WORKER['pipeline'] = PrepPipeline.from_dict(state)
+
+def _partition(part):
+    # a (start, stop) pair refers to the frame the worker inherited under fork
+    return _PREP_WORKER['frame'].iloc[part[0]:part[1]] if isinstance(part, tuple) else part
+
+def _partition_stats(part):
+    return _PREP_WORKER['pipeline'].partition_stats(_partition(part))
+
+def _transform_partition(part):
+    return _PREP_WORKER['pipeline'].transform(_partition(part))
+
+def concat_partitions(parts):
+    """
+    This function concatenates prepped partitions into one frame. String columns stored as
+    `category` (compact=True) get their categories from each partition's values, so columns whose
+    categories differ between partitions are re-encoded over the whole frame.
+
+    :param parts: a list of prepped dataframes with the same columns
+    :return: the concatenated dataframe.
+    """
+    df = pd.concat(parts)
+    for column in parts[0].columns:
+        if isinstance(parts[0][column].dtype, pd.CategoricalDtype) and \
+                not isinstance(df[column].dtype, pd.CategoricalDtype):
+            df[column] = df[column].astype('category')
+    return df
+
+@instrument.timed
+def prep_partitioned(data, pipeline, n_jobs=None, partitions=None):
+    """
+    This function cleans and encodes a large frame, or a stream of chunks such as
+    `acquire.stream_data`, across a process pool. The pipeline is fitted (or taken already fitted)
+    once and its vocabularies and means are shared with every worker, so each partition gets the
+    same dummy columns, and the prepped partitions are concatenated in order. An unfitted pipeline
+    is fitted on a frame in parallel too, from merged per-partition statistics (see
+    `PrepPipeline.partition_stats`). Where processes fork, workers read their partitions from the
+    parent's frame instead of receiving copies; the prepped partitions always travel back pickled,
+    so compact=True and drop_original=True (smaller outputs) also scale better.
+
+    :param data: a raw dataframe, or an iterable of raw dataframe chunks
+    :param pipeline: a PrepPipeline, e.g. PrepPipeline(**TELCO_PREP); it must already be fitted when
+    data is a stream of chunks, otherwise it is fitted in place on data
+    :param n_jobs: the number of worker processes, defaults to every core; 1 runs in this process
+    :param partitions: the number of row partitions of a frame, defaults to two per worker with at
+    least PARTITION_ROWS rows each (optional)
+    :return: the prepped dataframe, equal to `pipeline.fit_transform(data)` on the whole frame.
+    """
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+    n_jobs = n_jobs or os.cpu_count()
+    is_frame = isinstance(data, pd.DataFrame)
+    if not is_frame and pipeline.vocabulary_ is None:
+        raise ValueError('PrepPipeline must be fitted before transforming a stream of chunks')
+    if is_frame:
+        partitions = partitions or min(2 * n_jobs, -(-len(data) // PARTITION_ROWS))
+        bounds = partition_bounds(len(data), partitions)
+        if n_jobs == 1 or len(bounds) < 2:
+            if pipeline.vocabulary_ is None:
+                pipeline.fit(data)
+            return pipeline.transform(data)
+        context = multiprocessing.get_context()
+        if context.get_start_method() == 'fork':
+            _PREP_WORKER['frame'] = data
+            parts = bounds
+        else:
+            parts = [data.iloc[start:stop] for start, stop in bounds]
+    try:
+        if is_frame and pipeline.vocabulary_ is None:
+            with ProcessPoolExecutor(max_workers=n_jobs, mp_context=context,
+                                     initializer=_init_prep_worker,
+                                     initargs=(pipeline.to_dict(),)) as pool:
+                pipeline.fit_stats(list(pool.map(_partition_stats, parts)), data)
+        if n_jobs == 1:
+            return concat_partitions([pipeline.transform(chunk) for chunk in data])
+        with ProcessPoolExecutor(max_workers=n_jobs, mp_context=context if is_frame else None,
+                                 initializer=_init_prep_worker,
+                                 initargs=(pipeline.to_dict(),)) as pool:
+            if is_frame:
+                return concat_partitions(list(pool.map(_transform_partition, parts)))
+            # bound the chunks in flight so the stream is never fully materialized as raw rows
+            window, pending, prepped = 2 * n_jobs, [], []
+            for chunk in data:
+                pending.append(pool.submit(_transform_partition, chunk))
+                if len(pending) >= window:
+                    prepped.append(pending.pop(0).result())
+            return concat_partitions(prepped + [future.result() for future in pending])
+    finally:
+        _PREP_WORKER.clear()
+
+@instrument.timed
+def split_data(df, strat, test=.2, validate=.25, seed=42):
     """
     This function splits a given dataframe into training, validation, and test sets based on a given
-    stratification column and specified proportions.
+    stratification column and specified proportions. The split is computed (or loaded from the split
+    cache) as index arrays by `split_indices`, so only the three outputs are ever copied.
     
     :param df: The input dataframe that needs to be split into train, validate, and test sets
     :param strat: The strat parameter is the name of the column in the dataframe that will be used for
@@ -249,16 +641,195 @@ def split_data(df, strat, test=.2, validate=.25):
     is set to 0.2 or 20% of the data
     :param validate: The "validate" parameter is the proportion of the data that will be used for
     validation. It is set to 0.25, which means that 25% of the data will be used for validation
+    :param seed: the random state of the split, defaults to 42 (optional)
     :return: The function `split_data` returns three dataframes: `train`, `validate`, and `test`.
     """
-    print('data split')
-    st = [strat]
-    train_validate, test = train_test_split(df, test_size=test, random_state=42, stratify=df[st])
-    train, validate = train_test_split(train_validate, 
-                                        test_size=validate, 
-                                        random_state=42, 
-                                        stratify=train_validate[st])
-    print(f'train -> {train.shape}; {round(len(train)*100/len(df),2)}%')
-    print(f'validate -> {validate.shape}; {round(len(validate)*100/len(df),2)}%')
-    print(f'test -> {test.shape}; {round(len(test)*100/len(df),2)}%')
-    return train, validate, test
\ No newline at end of file
+    instrument.message('data split')
+    train, validate, test = [df.iloc[idx] for idx in split_indices(df, strat, test, validate, seed)]
+    instrument.message(f'train -> {train.shape}; {round(len(train)*100/len(df),2)}%')
+    instrument.message(f'validate -> {validate.shape}; {round(len(validate)*100/len(df),2)}%')
+    instrument.message(f'test -> {test.shape}; {round(len(test)*100/len(df),2)}%')
+    return train, validate, test
+
+def dataset_fingerprint(df, strat):
+    """
+    This function fingerprints the parts of a dataframe a stratified split depends on: its shape,
+    column names, index and stratify column.
+
+    :param df: a pandas DataFrame
+    :param strat: the name of the stratify column
+    :return: a hex digest string.
+    """
+    digest = hashlib.sha256(json.dumps([df.shape, [str(c) for c in df.columns], strat]).encode())
+    digest.update(pd.util.hash_pandas_object(df[strat], index=True).to_numpy().tobytes())
+    return digest.hexdigest()
+
+def split_indices(df, strat, test=.2, validate=.25, seed=42, cache=True):
+    """
+    This function computes a stratified train/validate/test split as positional index arrays, the
+    same split `train_test_split` gives on the dataframe itself, without copying any rows. Splits
+    are cached in SPLIT_CACHE_DIR keyed by the dataset fingerprint, stratify column, proportions and
+    seed, so repeated runs load them instead of recomputing.
+
+    :param df: the dataframe to split
+    :param strat: the name of the column to stratify on
+    :param test: The proportion of the data that should be allocated to the test set
+    :param validate: The proportion of the remaining data that should be allocated to validate
+    :param seed: the random state of the split, defaults to 42 (optional)
+    :param cache: read and write the split cache, defaults to True (optional)
+    :return: three NumPy integer arrays for `df.iloc`: train, validate, and test.
+    """
+    key = hashlib.sha256(json.dumps([dataset_fingerprint(df, strat), test, validate, seed])
+                         .encode()).hexdigest()[:24]
+    filename = os.path.join(SPLIT_CACHE_DIR, f'{key}.npz')
+    if cache and os.path.isfile(filename):
+        with np.load(filename) as cached:
+            return cached['train'], cached['validate'], cached['test']
+    from sklearn.model_selection import train_test_split
+    labels = df[strat].to_numpy()
+    train_validate, test_idx = train_test_split(np.arange(len(df)), test_size=test,
+                                                random_state=seed, stratify=labels)
+    train_idx, validate_idx = train_test_split(train_validate, test_size=validate,
+                                               random_state=seed, stratify=labels[train_validate])
+    if cache:
+        os.makedirs(SPLIT_CACHE_DIR, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=SPLIT_CACHE_DIR, suffix='.npz')
+        with os.fdopen(fd, 'wb') as f:
+            np.savez(f, train=train_idx, validate=validate_idx, test=test_idx)
+        os.replace(tmp, filename)
+    return train_idx, validate_idx, test_idx
+
+def hash_partition(df, key, test=.2, validate=.25, salt=''):
+    """
+    This function assigns each row to train, validate or test from a hash of a stable key column,
+    so a row lands in the same partition every time, however much the table has grown. The split is
+    not stratified: the hash ignores the target, so each class gets the requested proportions only
+    on average, off by roughly sqrt(p * (1 - p) / class rows) for a proportion p, which is noticeable
+    for rare classes. Check the per-class proportions with `partition_balance`.
+
+    :param df: the dataframe to partition
+    :param key: the name of the stable key column, e.g. 'passenger_id' or 'customer_id'
+    :param test: The proportion of the data that should be allocated to the test set
+    :param validate: The proportion of the remaining data that should be allocated to validate
+    :param salt: a string mixed into the hash to draw a different, equally stable split (optional)
+    :return: a NumPy array with 'train', 'validate' or 'test' for each row.
+    """
+    hashes = pd.util.hash_pandas_object(salt + df[key].astype(str), index=False).to_numpy()
+    position = hashes / np.float64(2**64)
+    return np.where(position < test, 'test',
+                    np.where(position < test + (1 - test) * validate, 'validate', 'train'))
+
+def partition_balance(partition, y):
+    """
+    This function checks how evenly each class is spread over a split's partitions, e.g. for an
+    unstratified `hash_partition`.
+
+    :param partition: the array of 'train', 'validate' and 'test' labels from `hash_partition`
+    :param y: the target values of the same rows
+    :return: a DataFrame with one row per class: its row count and the proportion of its rows in
+    train, validate and test.
+    """
+    shares = pd.crosstab(np.asarray(y), np.asarray(partition), normalize='index')
+    shares = shares.reindex(columns=['train', 'validate', 'test'], fill_value=0.0)
+    shares.insert(0, 'rows', pd.Series(np.asarray(y)).value_counts())
+    shares.index.name = None
+    shares.columns.name = None
+    return shares
+
+@instrument.timed
+def hash_split(df, key, test=.2, validate=.25, salt='', strat=None):
+    """
+    This function splits a dataframe into training, validation, and test sets by hashing a stable key
+    column, see `hash_partition`. Unlike `split_data`, adding rows never moves existing rows, but the
+    split is not stratified.
+
+    :param df: the dataframe to split
+    :param key: the name of the stable key column, e.g. 'passenger_id' or 'customer_id'
+    :param test: The proportion of the data that should be allocated to the test set
+    :param validate: The proportion of the remaining data that should be allocated to validate
+    :param salt: a string mixed into the hash to draw a different, equally stable split (optional)
+    :param strat: a target column whose per-class proportions are reported, see `partition_balance`
+    (optional)
+    :return: three dataframes: train, validate, and test.
+    """
+    instrument.message('data split')
+    partition = hash_partition(df, key, test, validate, salt)
+    if strat is not None:
+        instrument.message(partition_balance(partition, df[strat]).round(3).to_string())
+    train, validate, test = [df[partition == p] for p in ('train', 'validate', 'test')]
+    instrument.message(f'train -> {train.shape}; {round(len(train)*100/len(df),2)}%')
+    instrument.message(f'validate -> {validate.shape}; {round(len(validate)*100/len(df),2)}%')
+    instrument.message(f'test -> {test.shape}; {round(len(test)*100/len(df),2)}%')
+    return train, validate, test
+
+def hash_split_chunks(chunks, key, test=.2, validate=.25, salt=''):
+    """
+    This function hash-splits a chunked dataset, e.g. `acquire.stream_data`, one chunk at a time.
+
+    :param chunks: an iterable of pandas DataFrames
+    :param key: the name of the stable key column
+    :param test: The proportion of the data that should be allocated to the test set
+    :param validate: The proportion of the remaining data that should be allocated to validate
+    :param salt: a string mixed into the hash (optional)
+    :return: a generator of (train, validate, test) dataframe tuples, one per chunk.
+    """
+    for chunk in chunks:
+        partition = hash_partition(chunk, key, test, validate, salt)
+        yield tuple(chunk[partition == p] for p in ('train', 'validate', 'test'))
+
+@instrument.timed
+def append_hash_split(chunks, key, directory, test=.2, validate=.25, salt=''):
+    """
+    This function incrementally hash-splits new rows into partition directories
+    ("<directory>/train", "validate", "test"). Each chunk's rows go into new Parquet part files and
+    keys that are already stored are skipped, so existing partitions are never rewritten and a
+    refresh only has to stream the new rows.
+
+    :param chunks: an iterable of pandas DataFrames, e.g. `acquire.stream_data` chunks
+    :param key: the name of the stable key column
+    :param directory: the root directory of the partitions
+    :param test: The proportion of the data that should be allocated to the test set
+    :param validate: The proportion of the remaining data that should be allocated to validate
+    :param salt: a string mixed into the hash; keep it the same for every append (optional)
+    :return: a dict with the number of rows appended to each partition.
+    """
+    partitions = ('train', 'validate', 'test')
+    for p in partitions:
+        os.makedirs(os.path.join(directory, p), exist_ok=True)
+    existing = read_hash_split(directory, columns=[key])
+    seen = set(pd.concat(existing)[key].astype(str)) if any(len(e) for e in existing) else set()
+    appended = dict.fromkeys(partitions, 0)
+    for chunk in chunks:
+        chunk = chunk[~chunk[key].astype(str).isin(seen)]
+        if not len(chunk):
+            continue
+        seen.update(chunk[key].astype(str))
+        for p, rows in zip(partitions, next(hash_split_chunks([chunk], key, test, validate, salt))):
+            if not len(rows):
+                continue
+            name = hashlib.sha256(rows[key].astype(str).str.cat(sep='\n').encode()).hexdigest()[:16]
+            filename = os.path.join(directory, p, f'part-{name}.parquet')
+            fd, tmp = tempfile.mkstemp(dir=os.path.join(directory, p), suffix='.tmp')
+            os.close(fd)
+            rows.to_parquet(tmp, index=False)
+            os.replace(tmp, filename)
+            appended[p] += len(rows)
+    instrument.message(f'appended -> {appended}')
+    return appended
+
+def read_hash_split(directory, columns=None):
+    """
+    This function reads the partitions written by `append_hash_split`.
+
+    :param directory: the root directory of the partitions
+    :param columns: a list of column names to load, defaults to every column (optional)
+    :return: three dataframes: train, validate, and test.
+    """
+    splits = []
+    for p in ('train', 'validate', 'test'):
+        folder = os.path.join(directory, p)
+        parts = sorted(os.listdir(folder)) if os.path.isdir(folder) else []
+        parts = [f for f in parts if f.endswith('.parquet')]
+        frames = [pd.read_parquet(os.path.join(folder, f), columns=columns) for f in parts]
+        splits.append(pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=columns))
+    return tuple(splits)
@@ -0,0 +1,297 @@
+# imports
+import os
+import json
+from concurrent.futures import ProcessPoolExecutor
+from functools import reduce
+import numpy as np
+import pandas as pd
+
+# functions
+def merge_moments(a, b):
+    """
+    This function merges the running moments of two partitions (Chan et al.'s parallel form of
+    Welford's update).
+
+    :param a: a [count, mean, M2, min, max] list for one partition
+    :param b: the same list for the other partition
+    :return: the merged [count, mean, M2, min, max] list.
+    """
+    n_a, mean_a, m2_a, min_a, max_a = a
+    n_b, mean_b, m2_b, min_b, max_b = b
+    if not n_a:
+        return list(b)
+    if not n_b:
+        return list(a)
+    n = n_a + n_b
+    delta = mean_b - mean_a
+    return [n, mean_a + delta * n_b / n, m2_a + m2_b + delta ** 2 * n_a * n_b / n,
+            min(min_a, min_b), max(max_a, max_b)]
+
+def compress_centroids(means, weights, compression):
+    """
+    This function compresses a quantile sketch: centroids are sorted and merged into bins of equal
+    width on the t-digest k1 scale, which keeps small centroids near the tails and large ones in the
+    middle, so at most about compression / 2 centroids remain.
+
+    :param means: the centroid means
+    :param weights: the centroid weights (row counts)
+    :param compression: the t-digest compression parameter delta
+    :return: the compressed means and weights, sorted by mean.
+    """
+    order = np.argsort(means, kind='stable')
+    means, weights = means[order], weights[order]
+    q = (np.cumsum(weights) - weights / 2) / weights.sum()
+    k = compression / (2 * np.pi) * np.arcsin(2 * q - 1)
+    bins = np.floor(k + compression / 4).astype(np.intp)
+    w = np.bincount(bins, weights=weights)
+    m = np.bincount(bins, weights=means * weights)
+    keep = w > 0
+    return m[keep] / w[keep], w[keep]
+
+class DatasetProfile:
+    """
+    A mergeable one-pass summary of a dataset: per column null counts and value counts (up to
+    max_levels distinct values), and for numeric columns the count, mean, variance (Welford/Chan),
+    min, max and a t-digest-like quantile sketch. Profiles of chunks or partitions merge into the
+    profile of their concatenation, so a dataset can be profiled while it streams in, or in parallel.
+
+    :param compression: the quantile sketch compression; larger is more accurate, defaults to 400
+    :param max_levels: the most distinct values whose counts are kept per column, defaults to 100
+    """
+    def __init__(self, compression=400, max_levels=100):
+        self.compression = compression
+        self.max_levels = max_levels
+        self.rows = 0
+        self.nulls = {}
+        self.counts = {}
+        self.moments = {}
+        self.sketches = {}
+
+    def _merge_counts(self, a, b):
+        if a is None or b is None:
+            return None
+        merged = dict(a)
+        for value, count in b.items():
+            merged[value] = merged.get(value, 0) + count
+        return merged if len(merged) <= self.max_levels else None
+
+    def update(self, df):
+        """
+        This method adds a chunk of rows to the profile.
+
+        :param df: a dataframe chunk
+        :return: the profile itself.
+        """
+        chunk = DatasetProfile(self.compression, self.max_levels)
+        chunk.rows = len(df)
+        chunk.nulls = df.isna().sum().to_dict()
+        for col in df.columns:
+            if col in self.counts and self.counts[col] is None:
+                # already over max_levels, no need to count this chunk
+                chunk.counts[col] = None
+                continue
+            counts = df[col].value_counts(sort=False)
+            chunk.counts[col] = (dict(zip(counts.index.tolist(), counts.tolist()))
+                                 if len(counts) <= self.max_levels else None)
+        numeric = df.select_dtypes(include='number').columns
+        if len(numeric):
+            values = df[numeric].to_numpy(dtype=np.float64, na_value=np.nan)
+            present = ~np.isnan(values)
+            n = present.sum(axis=0)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                mean = np.nansum(values, axis=0) / n
+                m2 = np.nansum((values - mean) ** 2, axis=0)
+            for i, col in enumerate(numeric):
+                x = values[present[:, i], i]
+                if not len(x):
+                    chunk.moments[col] = [0, 0.0, 0.0, np.inf, -np.inf]
+                    continue
+                chunk.moments[col] = [int(n[i]), float(mean[i]), float(m2[i]),
+                                      float(x.min()), float(x.max())]
+                chunk.sketches[col] = compress_centroids(x, np.ones(len(x)), self.compression)
+        return self.merge(chunk)
+
+    def merge(self, other):
+        """
+        This method merges another profile (e.g. of another chunk or worker partition) into this one.
+
+        :param other: a DatasetProfile
+        :return: the profile itself.
+        """
+        self.rows += other.rows
+        for col, nulls in other.nulls.items():
+            self.nulls[col] = self.nulls.get(col, 0) + nulls
+        for col, counts in other.counts.items():
+            self.counts[col] = self._merge_counts(self.counts[col], counts) if col in self.counts \
+                else counts
+        for col, moments in other.moments.items():
+            self.moments[col] = merge_moments(self.moments[col], moments) if col in self.moments \
+                else list(moments)
+        for col, (means, weights) in other.sketches.items():
+            if col in self.sketches:
+                means = np.concatenate([self.sketches[col][0], means])
+                weights = np.concatenate([self.sketches[col][1], weights])
+            self.sketches[col] = compress_centroids(means, weights, self.compression)
+        return self
+
+    def _value_counts(self, col):
+        values = np.array(sorted(self.counts[col]), dtype=np.float64)
+        return values, np.array([self.counts[col][v] for v in sorted(self.counts[col])])
+
+    @property
+    def columns(self):
+        return list(self.nulls)
+
+    def quantile(self, col, q):
+        """
+        This method estimates quantiles of a numeric column from its sketch, interpolating like
+        pandas' default. Quantiles are exact for columns with value counts (at most max_levels
+        distinct values) and while the column has fewer rows than centroids.
+
+        :param col: a numeric column
+        :param q: a quantile or array of quantiles in [0, 1]
+        :return: the estimated quantile value(s).
+        """
+        n, _, _, low, high = self.moments[col]
+        if self.counts.get(col) is not None:
+            values, counts = self._value_counts(col)
+            position = np.asarray(q) * (n - 1)
+            lower = values[np.searchsorted(np.cumsum(counts), np.floor(position), side='right')]
+            upper = values[np.searchsorted(np.cumsum(counts), np.ceil(position), side='right')]
+            return lower + (upper - lower) * (position - np.floor(position))
+        means, weights = self.sketches[col]
+        positions = np.concatenate([[0.0], np.cumsum(weights) - weights / 2, [n]])
+        values = np.concatenate([[low], means, [high]])
+        return np.interp(np.asarray(q) * (n - 1) + 0.5, positions, values)
+
+    def histogram(self, col, bins=10):
+        """
+        This method estimates the histogram of a numeric column from its sketch (exact for columns
+        with value counts).
+
+        :param col: a numeric column
+        :param bins: the number of equal-width bins between min and max, defaults to 10 (optional)
+        :return: the estimated counts and the bin edges, like np.histogram.
+        """
+        n, _, _, low, high = self.moments[col]
+        if self.counts.get(col) is not None:
+            values, counts = self._value_counts(col)
+            return np.histogram(values, bins=bins, range=(low, high), weights=counts)
+        means, weights = self.sketches[col]
+        edges = np.linspace(low, high, bins + 1)
+        positions = np.concatenate([[0.0], np.cumsum(weights) - weights / 2, [n]])
+        values = np.concatenate([[low], means, [high]])
+        cumulative = np.interp(edges, values, positions)
+        cumulative[0], cumulative[-1] = 0.0, n
+        return np.diff(cumulative), edges
+
+    def describe(self, col):
+        """
+        This method gives the `describe()` summary of a numeric column, with estimated quartiles.
+
+        :param col: a numeric column
+        :return: a Series with count, mean, std, min, 25%, 50%, 75% and max.
+        """
+        n, mean, m2, low, high = self.moments[col]
+        std = np.sqrt(m2 / (n - 1)) if n > 1 else np.nan
+        quartiles = self.quantile(col, [.25, .5, .75]) if n else [np.nan] * 3
+        return pd.Series([float(n), mean if n else np.nan, std, low if n else np.nan, *quartiles,
+                          high if n else np.nan],
+                         index=['count', 'mean', 'std', 'min', '25%', '50%', '75%', 'max'], name=col)
+
+    def freq_table(self, col):
+        """
+        This method gives the `explore.freq_table` frequency table of a column from its value counts.
+
+        :param col: a column with at most max_levels distinct values
+        :return: a DataFrame with the values, Count and Percent, most frequent first.
+        """
+        if self.counts.get(col) is None:
+            raise ValueError(f'{col} has more than {self.max_levels} distinct values')
+        counts = pd.Series(self.counts[col], dtype='int64').sort_values(ascending=False, kind='stable')
+        return pd.DataFrame({col: counts.index, 'Count': counts,
+                             'Percent': round(counts / counts.sum() * 100, 2)})
+
+    def to_dict(self):
+        """
+        This method returns the profile as plain JSON-serializable data.
+        """
+        return {
+            'compression': self.compression, 'max_levels': self.max_levels, 'rows': self.rows,
+            'columns': [{
+                'name': col, 'nulls': int(self.nulls[col]),
+                'counts': None if self.counts.get(col) is None else
+                [[v.item() if hasattr(v, 'item') else v, int(c)] for v, c in self.counts[col].items()],
+                'moments': self.moments.get(col),
+                'sketch': [a.tolist() for a in self.sketches[col]] if col in self.sketches else None,
+            } for col in self.columns],
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        This method rebuilds a profile from `to_dict` output.
+        """
+        profile = cls(data['compression'], data['max_levels'])
+        profile.rows = data['rows']
+        for column in data['columns']:
+            col = column['name']
+            profile.nulls[col] = column['nulls']
+            profile.counts[col] = None if column['counts'] is None else dict(
+                (v, c) for v, c in column['counts'])
+            if column['moments'] is not None:
+                profile.moments[col] = column['moments']
+            if column['sketch'] is not None:
+                profile.sketches[col] = tuple(np.array(a) for a in column['sketch'])
+        return profile
+
+    def save(self, path):
+        """
+        This method writes the profile to a JSON file.
+        """
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f)
+
+    @classmethod
+    def load(cls, path):
+        """
+        This method reads a profile written by `save`.
+        """
+        with open(path) as f:
+            return cls.from_dict(json.load(f))
+
+def profile_frame(df, **kwargs):
+    """
+    This function profiles a dataframe in one pass.
+
+    :param df: a dataframe
+    :param kwargs: DatasetProfile parameters (compression, max_levels)
+    :return: a DatasetProfile.
+    """
+    return DatasetProfile(**kwargs).update(df)
+
+def profile_chunks(chunks, n_jobs=1, **kwargs):
+    """
+    This function profiles a stream of chunks, e.g. from `acquire.stream_data`, without holding more
+    than a few chunks in memory. With n_jobs > 1 the chunks are profiled across a process pool and the
+    partial profiles merged.
+
+    :param chunks: an iterable of dataframe chunks
+    :param n_jobs: the number of worker processes, defaults to 1 (in this process) (optional)
+    :param kwargs: DatasetProfile parameters (compression, max_levels)
+    :return: a DatasetProfile.
+    """
+    profile = DatasetProfile(**kwargs)
+    if n_jobs == 1:
+        for chunk in chunks:
+            profile.update(chunk)
+        return profile
+    window = 2 * (n_jobs or os.cpu_count())
+    with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+        pending = []
+        for chunk in chunks:
+            pending.append(pool.submit(profile_frame, chunk, **kwargs))
+            # bound the chunks in flight so the stream is never fully materialized
+            if len(pending) >= window:
+                profile.merge(pending.pop(0).result())
+        return reduce(lambda merged, future: merged.merge(future.result()), pending, profile)
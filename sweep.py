@@ -0,0 +1,666 @@
+# imports
+import os
+import time
+import tempfile
+import itertools
+import numpy as np
+import pandas as pd
+import instrument
+
+# worker state: the shared feature matrices, opened once per worker process
+_SHARED = {}
+
+# functions
+def param_grid(grid):
+    """
+    This function expands a parameter grid into the list of parameter combinations to fit.
+
+    :param grid: a dict of parameter name -> list of values (every combination is fitted, like the
+    itertools.product loops in the notebooks), or a list of such dicts / of parameter dicts
+    :return: a list of parameter dicts.
+    """
+    if isinstance(grid, dict):
+        names = list(grid)
+        return [dict(zip(names, values)) for values in itertools.product(*grid.values())]
+    return [params for g in grid for params in (param_grid(g) if any(
+        isinstance(v, (list, tuple, range)) for v in g.values()) else [g])]
+
+def xy_split(df, target, features=None):
+    """
+    This function separates a split dataframe into a float feature matrix and a target array.
+
+    :param df: a train, validate or test dataframe from `prepare.split_data`
+    :param target: the name of the target column
+    :param features: a list of feature columns, defaults to every numeric column except the target
+    :return: the feature matrix X (float64 NumPy array) and the target y (NumPy array).
+    """
+    if features is None:
+        features = [c for c in df.select_dtypes(include=['number', 'bool']).columns if c != target]
+    return df[features].to_numpy(dtype=np.float64), df[target].to_numpy()
+
+def n_workers(n_jobs=None):
+    """
+    This function resolves an n_jobs setting the way sklearn does.
+
+    :param n_jobs: None or -1 for every core, -2 for all but one and so on, or a positive count
+    :return: the number of worker processes, at least 1.
+    """
+    if n_jobs is None:
+        return os.cpu_count()
+    return max(os.cpu_count() + 1 + n_jobs if n_jobs < 0 else n_jobs, 1)
+
+def _init_worker(paths):
+    _SHARED.clear()
+    for name, path in paths.items():
+        _SHARED[name] = np.load(path, mmap_mode='r')
+
+def _fit_one(estimator, params):
+    model = estimator(**params)
+    start = time.perf_counter()
+    model.fit(_SHARED['Xtr'], _SHARED['ytr'])
+    fit_seconds = time.perf_counter() - start
+    return dict(params,
+                train_score=model.score(_SHARED['Xtr'], _SHARED['ytr']),
+                validate_score=model.score(_SHARED['Xv'], _SHARED['yv']),
+                fit_seconds=round(fit_seconds, 4))
+
+@instrument.timed
+def run_sweep(estimator, grid, train, validate, target, features=None, n_jobs=None, stop_at=None):
+    """
+    This function fits an estimator for every combination in a parameter grid across a process pool
+    and scores each fit on train and validate. X and y are written once to memory-mapped .npy files
+    that every worker maps read-only, instead of being pickled for each task.
+
+    :param estimator: a picklable factory called with each parameter dict, e.g. DecisionTreeClassifier
+    or a functools.partial of it (lambdas cannot be sent to worker processes)
+    :param grid: a dict of parameter name -> list of values, see `param_grid`
+    :param train: the train dataframe from `prepare.split_data`
+    :param validate: the validate dataframe from `prepare.split_data`
+    :param target: the name of the target column
+    :param features: a list of feature columns, defaults to every numeric column except the target
+    :param n_jobs: the number of worker processes, None or -1 for every core (see `n_workers`),
+    defaults to every core; 1 fits in this process
+    :param stop_at: stop once a fit reaches this validate score; fits are submitted one per worker
+    at a time, so only the fits already running still finish (optional)
+    :return: a tidy DataFrame with one row per fit: the parameters, train_score, validate_score,
+    diff_score, avg_score and fit_seconds, in grid order.
+    """
+    combos = param_grid(grid)
+    Xtr, ytr = xy_split(train, target, features)
+    Xv, yv = xy_split(validate, target, features)
+    # integer-code the labels so y can be memory-mapped too; accuracy is unchanged
+    classes, codes = np.unique(np.concatenate([ytr, yv]).astype(str), return_inverse=True)
+    ytr, yv = codes[:len(ytr)], codes[len(ytr):]
+    results = {}
+    with tempfile.TemporaryDirectory() as folder:
+        paths = {}
+        for name, array in [('Xtr', Xtr), ('ytr', ytr), ('Xv', Xv), ('yv', yv)]:
+            paths[name] = os.path.join(folder, f'{name}.npy')
+            np.save(paths[name], array)
+        n_jobs = n_workers(n_jobs)
+        if n_jobs == 1:
+            _init_worker(paths)
+            for i, params in enumerate(combos):
+                results[i] = _fit_one(estimator, params)
+                if stop_at is not None and results[i]['validate_score'] >= stop_at:
+                    break
+            _SHARED.clear()
+        else:
+            from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+            with ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_worker,
+                                     initargs=(paths,)) as pool:
+                # one fit in flight per worker (the pool hands queued calls to workers early, where
+                # they can no longer be cancelled), so stop_at saves every fit not yet started
+                todo, pending = iter(enumerate(combos)), {}
+                stopped = False
+                while True:
+                    while not stopped and len(pending) < n_jobs:
+                        i, params = next(todo, (None, None))
+                        if i is None:
+                            break
+                        pending[pool.submit(_fit_one, estimator, params)] = i
+                    if not pending:
+                        break
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        i = pending.pop(future)
+                        results[i] = future.result()
+                        if stop_at is not None and results[i]['validate_score'] >= stop_at:
+                            stopped = True
+    df = pd.DataFrame([results[i] for i in sorted(results)])
+    # Calculate the difference between the train and validation scores
+    df['diff_score'] = abs(df.train_score - df.validate_score)
+    df['avg_score'] = (df.train_score + df.validate_score)/2
+    instrument.message(f'{len(df)} of {len(combos)} fits -> {round(df.fit_seconds.sum(), 2)}s fitting')
+    return df
+
+### Feature selection
+
+def subset_scorer(train, validate, target, features=None, c_values=None, max_iter=100):
+    """
+    This function builds a cached scorer for logistic regression feature subsets. Each subset is fitted
+    once per C value, in increasing C order with a warm-started solver, so every fit after the first
+    starts from the previous coefficients.
+
+    :param train: the train dataframe from `prepare.split_data`
+    :param validate: the validate dataframe from `prepare.split_data`
+    :param target: the name of the target column
+    :param features: the candidate feature columns, defaults to every numeric column except the target
+    :param c_values: the C values to try, defaults to [.01, .1, 1, 10, 100, 1000] like `l_scores`
+    :param max_iter: the solver's iteration limit, defaults to 100 (optional)
+    :return: a function score(subset, rows=None) returning one result dict per C value, with the
+    number of train rows fitted; results are cached in its `cache` attribute, keyed by the frozenset
+    of features for full-data fits and by (frozenset, rows, row digest) for fits on a row sample.
+    """
+    import warnings
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.exceptions import ConvergenceWarning
+    if features is None:
+        features = [c for c in train.select_dtypes(include=['number', 'bool']).columns if c != target]
+    c_values = sorted(c_values or [.01, .1, 1, 10, 100, 1000])
+    Xtr, ytr = xy_split(train, target, features)
+    Xv, yv = xy_split(validate, target, features)
+    column = {f: i for i, f in enumerate(features)}
+    cache = {}
+
+    def score(subset, rows=None):
+        key = frozenset(subset) if rows is None else \
+            (frozenset(subset), len(rows), hash(np.asarray(rows).tobytes()))
+        if key in cache:
+            return cache[key]
+        cols = [column[f] for f in subset]
+        X, y = (Xtr, ytr) if rows is None else (Xtr[rows], ytr[rows])
+        X = X[:, cols]
+        model = LogisticRegression(random_state=42, max_iter=max_iter, warm_start=True)
+        results = []
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', ConvergenceWarning)
+            for c in c_values:
+                model.set_params(C=c)
+                model.fit(X, y)
+                results.append({'features': list(subset), 'n_features': len(subset), 'c_value': c,
+                                'rows': len(y), 'train_score': model.score(X, y),
+                                'validate_score': model.score(Xv[:, cols], yv)})
+        cache[key] = results
+        return results
+
+    score.cache = cache
+    score.features = features
+    score.n_rows = len(Xtr)
+    score.target = ytr
+    return score
+
+def _best(results):
+    return max(results, key=lambda r: r['validate_score'])['validate_score']
+
+def ranked_table(scorer):
+    """
+    This function turns every cached subset result into a table ranked by validate score. Fits on
+    row samples (e.g. the early rounds of `successive_halving`) are kept and ranked after the fits on
+    more rows, since scores from smaller samples are noisier.
+
+    :param scorer: a scorer from `subset_scorer`
+    :return: a DataFrame with features, n_features, c_value, rows, train_score, validate_score,
+    diff_score and avg_score, most rows and then best validate score first.
+    """
+    df = pd.DataFrame([r for results in scorer.cache.values() for r in results])
+    # Calculate the difference between the train and validation scores
+    df['diff_score'] = abs(df.train_score - df.validate_score)
+    df['avg_score'] = (df.train_score + df.validate_score)/2
+    return df.sort_values(['rows', 'validate_score', 'diff_score', 'n_features'],
+                          ascending=[False, False, True, True]).reset_index(drop=True)
+
+def forward_selection(scorer, max_features=None, tol=0.0):
+    """
+    This function greedily adds the feature that most improves the best validate score, stopping when
+    no addition improves it by more than tol. It needs O(n^2) subset fits instead of 2^n.
+
+    :param scorer: a scorer from `subset_scorer`
+    :param max_features: stop at this many features, defaults to all of them (optional)
+    :param tol: the minimum validate score gain to keep going, defaults to 0 (optional)
+    :return: the selected feature list.
+    """
+    selected, remaining, best = [], list(scorer.features), -np.inf
+    while remaining and len(selected) < (max_features or len(scorer.features)):
+        scores = {f: _best(scorer(selected + [f])) for f in remaining}
+        feature = max(scores, key=scores.get)
+        if scores[feature] <= best + tol and selected:
+            break
+        selected.append(feature)
+        remaining.remove(feature)
+        best = scores[feature]
+    return selected
+
+def backward_elimination(scorer, min_features=1, tol=0.0):
+    """
+    This function starts from every feature and greedily removes the feature whose removal gives the
+    best validate score, as long as that score does not drop by more than tol.
+
+    :param scorer: a scorer from `subset_scorer`
+    :param min_features: never go below this many features, defaults to 1 (optional)
+    :param tol: the largest validate score drop accepted for a removal, defaults to 0 (optional)
+    :return: the selected feature list.
+    """
+    selected = list(scorer.features)
+    best = _best(scorer(selected))
+    while len(selected) > min_features:
+        scores = {f: _best(scorer([s for s in selected if s != f])) for f in selected}
+        feature = max(scores, key=scores.get)
+        if scores[feature] < best - tol:
+            break
+        selected.remove(feature)
+        best = max(best, scores[feature])
+    return selected
+
+def stratified_order(y, rng, min_class_rows=5):
+    """
+    This function shuffles row positions so that every prefix is a stratified sample: the first
+    min_class_rows rows of each class come first, round robin, and the rest are interleaved in
+    proportion to the class sizes.
+
+    :param y: the target array
+    :param rng: a NumPy random Generator
+    :param min_class_rows: rows of each class placed at the front, defaults to 5 (optional)
+    :return: a permutation of the row positions.
+    """
+    order = rng.permutation(len(y))
+    _, codes, counts = np.unique(y[order], return_inverse=True, return_counts=True)
+    codes = codes.ravel()
+    # rank of each row within its class, in shuffled order
+    rank = np.empty(len(order), dtype=np.float64)
+    for c in range(len(counts)):
+        rank[codes == c] = np.arange(counts[c])
+    key = np.where(rank < min_class_rows, rank - min_class_rows, (rank + 1) / counts[codes])
+    return order[np.argsort(key, kind='stable')]
+
+def successive_halving(scorer, subsets=None, n_candidates=243, min_size=2, eta=3, seed=42,
+                       min_class_rows=5):
+    """
+    This function races many feature subsets against each other: every candidate is fitted on a small
+    sample of the train rows, only the best 1/eta advance, and each round the survivors get eta times
+    more rows, until the last few are fitted on the full train split.
+
+    :param scorer: a scorer from `subset_scorer`
+    :param subsets: the candidate subsets, defaults to n_candidates random subsets (optional)
+    :param n_candidates: how many random subsets to draw when subsets is None, defaults to 243
+    :param min_size: the smallest random subset size, defaults to 2 (optional)
+    :param eta: the elimination factor per round, defaults to 3 (optional)
+    :param seed: the random seed for the subsets and row samples, defaults to 42 (optional)
+    :param min_class_rows: the fewest rows of each class in a sample, defaults to 5 (optional)
+    :return: the surviving subsets, best first.
+    """
+    rng = np.random.default_rng(seed)
+    features = scorer.features
+    if subsets is None:
+        subsets = {tuple(sorted(str(f) for f in rng.choice(
+                       features, size=rng.integers(min_size, len(features) + 1), replace=False)))
+                   for _ in range(n_candidates)}
+    candidates = [list(s) for s in subsets]
+    # samples are prefixes of a stratified order, so every class is in every round's sample
+    order = stratified_order(scorer.target, rng, min_class_rows)
+    n_classes = len(np.unique(scorer.target))
+    rounds = max(int(np.ceil(np.log(len(candidates)) / np.log(eta))), 0)
+    rows = max(len(order) // eta**rounds, n_classes * min_class_rows, 10)
+    while len(candidates) > 1 and rows < len(order):
+        sample = np.sort(order[:rows])
+        scores = [_best(scorer(c, rows=sample)) for c in candidates]
+        keep = max(len(candidates) // eta, 1)
+        candidates = [candidates[i] for i in np.argsort(scores)[::-1][:keep]]
+        rows *= eta
+    return sorted(candidates, key=lambda c: _best(scorer(c)), reverse=True)
+
+@instrument.timed
+def select_features(train, validate, target, method='forward', features=None, c_values=None,
+                    max_iter=100, **kwargs):
+    """
+    This function searches for a good logistic regression feature subset without fitting every
+    itertools.combinations subset, then ranks every subset it fitted.
+
+    :param train: the train dataframe from `prepare.split_data`
+    :param validate: the validate dataframe from `prepare.split_data`
+    :param target: the name of the target column
+    :param method: 'forward', 'backward' or 'halving', defaults to 'forward' (optional)
+    :param features: the candidate feature columns, defaults to every numeric column except the target
+    :param c_values: the C values to try, defaults to those of `l_scores` (optional)
+    :param max_iter: the solver's iteration limit, defaults to 100 (optional)
+    :param kwargs: passed on to `forward_selection`, `backward_elimination` or `successive_halving`
+    :return: the selected feature list, and the ranked table of every subset and C value fitted.
+    """
+    scorer = subset_scorer(train, validate, target, features, c_values, max_iter)
+    start = time.perf_counter()
+    if method == 'forward':
+        selected = forward_selection(scorer, **kwargs)
+    elif method == 'backward':
+        selected = backward_elimination(scorer, **kwargs)
+    elif method == 'halving':
+        selected = successive_halving(scorer, **kwargs)[0]
+    else:
+        raise ValueError(f"unknown method {method!r}, expected 'forward', 'backward' or 'halving'")
+    instrument.message(f'{len(scorer.cache)} subset fits -> {round(time.perf_counter() - start, 2)}s')
+    return selected, ranked_table(scorer)
+
+### KNN
+
+def knn_neighbors(Xtr, Xq, k, chunk_size=10_000, algorithm='auto'):
+    """
+    This function finds the k nearest train rows of every query row once, querying in chunks so the
+    distance computation never holds more than chunk_size query rows at a time.
+
+    :param Xtr: the train feature matrix
+    :param Xq: the query feature matrix (validate, or train itself for train scores)
+    :param k: the number of neighbors to find, the largest n_neighbors of the sweep
+    :param chunk_size: query rows per chunk, defaults to 10,000 (optional)
+    :param algorithm: the sklearn NearestNeighbors algorithm, defaults to 'auto' (optional)
+    :return: the distances and the train row indices of the neighbors, both (rows, k) arrays sorted
+    nearest first.
+    """
+    from sklearn.neighbors import NearestNeighbors
+    nn = NearestNeighbors(n_neighbors=k, algorithm=algorithm).fit(Xtr)
+    distances = np.empty((len(Xq), k))
+    indices = np.empty((len(Xq), k), dtype=np.intp)
+    for start in range(0, len(Xq), chunk_size):
+        stop = start + chunk_size
+        distances[start:stop], indices[start:stop] = nn.kneighbors(Xq[start:stop])
+    return distances, indices
+
+def knn_accuracies(ytr, yq, distances, indices, chunk_size=10_000):
+    """
+    This function derives the KNeighborsClassifier accuracy for every n_neighbors up to k and both
+    weightings from one precomputed neighbor graph: cumulative vote counts along the neighbor axis
+    give every smaller k at once. Ties are broken towards the smallest label, like sklearn.
+
+    :param ytr: the train labels
+    :param yq: the labels of the query rows
+    :param distances: the neighbor distances from `knn_neighbors`
+    :param indices: the neighbor indices from `knn_neighbors`
+    :param chunk_size: query rows per chunk, bounds the (rows, k, classes) vote arrays (optional)
+    :return: a dict of weight -> NumPy array of accuracies for n_neighbors = 1..k.
+    """
+    classes, ytr_codes = np.unique(np.asarray(ytr).astype(str), return_inverse=True)
+    yq = np.asarray(yq).astype(str)
+    yq_codes = np.where(np.isin(yq, classes), np.searchsorted(classes, yq), -1)
+    n_classes = len(classes)
+    correct = {'uniform': 0, 'distance': 0}
+    for start in range(0, len(yq), chunk_size):
+        stop = start + chunk_size
+        onehot = ytr_codes[indices[start:stop]][..., None] == np.arange(n_classes)
+        truth = yq_codes[start:stop, None]
+        # uniform: plain vote counts over the first k neighbors
+        votes = onehot.cumsum(axis=1, dtype=np.int32)
+        correct['uniform'] = correct['uniform'] + (votes.argmax(axis=2) == truth).sum(axis=0)
+        # distance: 1/d weights; rows with an exact match only count the zero-distance neighbors
+        d = distances[start:stop]
+        with np.errstate(divide='ignore'):
+            weights = np.where(d > 0, 1.0 / d, 0.0)
+        votes = (onehot * weights[..., None]).cumsum(axis=1)
+        exact = d[:, 0] == 0
+        if exact.any():
+            votes[exact] = (onehot[exact] * (d[exact] == 0)[..., None]).cumsum(axis=1)
+        correct['distance'] = correct['distance'] + (votes.argmax(axis=2) == truth).sum(axis=0)
+    return {weight: count / len(yq) for weight, count in correct.items()}
+
+@instrument.timed
+def knn_sweep(train, validate, target, k_max=20, features=None, chunk_size=10_000):
+    """
+    This function builds the table `knn_scores` builds, for n_neighbors 1..k_max and both weightings,
+    from one neighbor query per split instead of one fit and score per configuration. The algorithm
+    does not change the predictions (up to ties between equidistant neighbors), so it is left out
+    of the grid; time the backends separately with `time_knn_algorithms`.
+
+    :param train: the train dataframe from `prepare.split_data`
+    :param validate: the validate dataframe from `prepare.split_data`
+    :param target: the name of the target column
+    :param k_max: the largest n_neighbors to score, defaults to 20 (optional)
+    :param features: a list of feature columns, defaults to every numeric column except the target
+    :param chunk_size: query rows per chunk, defaults to 10,000 (optional)
+    :return: a DataFrame with neighbors, weight, train_score, validate_score, diff_score and avg_score.
+    """
+    Xtr, ytr = xy_split(train, target, features)
+    Xv, yv = xy_split(validate, target, features)
+    train_acc = knn_accuracies(ytr, ytr, *knn_neighbors(Xtr, Xtr, k_max, chunk_size), chunk_size)
+    validate_acc = knn_accuracies(ytr, yv, *knn_neighbors(Xtr, Xv, k_max, chunk_size), chunk_size)
+    metrics = []
+    for n, w in itertools.product(range(1, k_max + 1), ['uniform', 'distance']):
+        metrics.append({'neighbors': n, 'weight': w,
+                        'train_score': train_acc[w][n - 1],
+                        'validate_score': validate_acc[w][n - 1]})
+    df = pd.DataFrame(metrics)
+    # Calculate the difference between the train and validation scores
+    df['diff_score'] = abs(df.train_score - df.validate_score)
+    df['avg_score'] = (df.train_score + df.validate_score)/2
+    return df
+
+def time_knn_algorithms(train, validate, target, k=20, features=None,
+                        algorithms=('auto', 'ball_tree', 'kd_tree', 'brute')):
+    """
+    This function times the NearestNeighbors backends on their own: fit (index build) and one
+    k-neighbor query of the validate rows.
+
+    :param train: the train dataframe from `prepare.split_data`
+    :param validate: the validate dataframe from `prepare.split_data`
+    :param target: the name of the target column
+    :param k: the number of neighbors to query, defaults to 20 (optional)
+    :param features: a list of feature columns, defaults to every numeric column except the target
+    :param algorithms: the backends to time (optional)
+    :return: a DataFrame with algorithm, fit_seconds and query_seconds.
+    """
+    from sklearn.neighbors import NearestNeighbors
+    Xtr, _ = xy_split(train, target, features)
+    Xv, _ = xy_split(validate, target, features)
+    metrics = []
+    for algorithm in algorithms:
+        start = time.perf_counter()
+        nn = NearestNeighbors(n_neighbors=k, algorithm=algorithm).fit(Xtr)
+        fitted = time.perf_counter()
+        nn.kneighbors(Xv)
+        metrics.append({'algorithm': algorithm, 'fit_seconds': round(fitted - start, 4),
+                        'query_seconds': round(time.perf_counter() - fitted, 4)})
+    return pd.DataFrame(metrics)
+
+### Decision trees
+
+def tree_paths(tree, X):
+    """
+    This function routes every row through a fitted tree once and lays its decision path out by
+    depth, padding paths that end early with their leaf.
+
+    :param tree: a fitted DecisionTreeClassifier
+    :param X: a feature matrix
+    :return: a (rows, tree depth + 1) array of node ids, column d holding the node at depth d.
+    """
+    indicator = tree.decision_path(X).tocsr()
+    indicator.sort_indices()
+    lengths = np.diff(indicator.indptr)
+    leaves = indicator.indices[indicator.indptr[1:] - 1]
+    paths = np.repeat(leaves[:, None], tree.get_depth() + 1, axis=1)
+    rows = np.repeat(np.arange(len(lengths)), lengths)
+    # node ids increase from parent to child, so sorted indices are in depth order
+    paths[rows, np.arange(len(rows)) - np.repeat(indicator.indptr[:-1], lengths)] = indicator.indices
+    return paths
+
+def prune_alphas(tree):
+    """
+    This function replays sklearn's minimal cost-complexity (weakest link) pruning on a fitted tree
+    and records the ccp_alpha at which every internal node becomes a leaf.
+
+    :param tree: a fitted DecisionTreeClassifier
+    :return: a per-node array of pruning alphas (-inf for leaves, inf for nodes only ever removed
+    with an ancestor) and the sorted unique alphas of the pruning path, starting at 0.
+    """
+    t = tree.tree_
+    left, right = t.children_left, t.children_right
+    n_nodes = t.node_count
+    parent = np.full(n_nodes, -1)
+    internal = np.flatnonzero(left != -1)
+    parent[left[internal]], parent[right[internal]] = internal, internal
+    r_node = t.weighted_n_node_samples * t.impurity / t.weighted_n_node_samples[0]
+    # subtree totals, accumulated from the deepest ids up since children follow their parents
+    r_branch = np.where(left == -1, r_node, 0.0)
+    n_leaves = (left == -1).astype(np.int64)
+    for node in range(n_nodes - 1, 0, -1):
+        r_branch[parent[node]] += r_branch[node]
+        n_leaves[parent[node]] += n_leaves[node]
+    alphas = np.full(n_nodes, np.inf)
+    alphas[left == -1] = -np.inf
+    candidate = left != -1
+    reached = 0.0
+    while candidate[0]:
+        effective = np.full(n_nodes, np.inf)
+        effective[candidate] = (r_node[candidate] - r_branch[candidate]) / (n_leaves[candidate] - 1)
+        node = int(np.argmin(effective))
+        # a ccp_alpha fit keeps pruning while the weakest link is <= ccp_alpha
+        reached = max(reached, effective[node])
+        alphas[node] = reached
+        stack = [left[node], right[node]]
+        while stack:
+            child = stack.pop()
+            if child != -1:
+                candidate[child] = False
+                stack.extend([left[child], right[child]])
+        candidate[node] = False
+        delta_r, delta_leaves = r_node[node] - r_branch[node], n_leaves[node] - 1
+        ancestor = node
+        while ancestor != -1:
+            r_branch[ancestor] += delta_r
+            n_leaves[ancestor] -= delta_leaves
+            ancestor = parent[ancestor]
+    path = np.unique(np.concatenate([[0.0], alphas[np.isfinite(alphas)]]))
+    return alphas, path
+
+def _truncated_nodes(paths, node_alphas, alpha):
+    # the first node on each path that is a leaf once the tree is pruned at alpha; sklearn only
+    # prunes for ccp_alpha > 0
+    if alpha <= 0:
+        return paths[:, -1]
+    stop = (node_alphas[paths] <= alpha).argmax(axis=1)
+    return paths[np.arange(len(paths)), stop]
+
+@instrument.timed
+def tree_path_scores(train, validate, target, features=None, max_depth=None, truncate=True,
+                     **params):
+    """
+    This function grows one decision tree and scores every max_depth truncation and every
+    cost-complexity pruning alpha of it by routing the train and validate rows through the tree
+    once, instead of refitting a DecisionTreeClassifier for each setting. The alpha scores are
+    exactly those of ccp_alpha refits. Truncating the tree at depth d matches a max_depth=d fit only
+    when no two splits tie: sklearn breaks ties with a random feature order whose draws change once
+    the depth limit stops the tree early, so truncated depth scores can be slightly off (pass
+    truncate=False to refit each depth instead).
+
+    :param train: the train dataframe from `prepare.split_data`
+    :param validate: the validate dataframe from `prepare.split_data`
+    :param target: the name of the target column
+    :param features: a list of feature columns, defaults to every numeric column except the target
+    :param max_depth: the depth to grow the tree to, defaults to None (fully grown) (optional)
+    :param truncate: score the depths by truncating the grown tree, defaults to True; False refits
+    a tree per max_depth, exact but one fit per depth (optional)
+    :param params: other DecisionTreeClassifier parameters, random_state defaults to 42
+    :return: a DataFrame with max_depth, train_acc, val_acc, diff and method ('refit', or 'truncated'
+    for the approximate scores), like the notebook table, and a DataFrame with ccp_alpha, n_leaves,
+    train_acc, val_acc and diff.
+    """
+    from sklearn.tree import DecisionTreeClassifier
+    Xtr, ytr = xy_split(train, target, features)
+    Xv, yv = xy_split(validate, target, features)
+    params.setdefault('random_state', 42)
+    tree = DecisionTreeClassifier(max_depth=max_depth, **params).fit(Xtr, ytr)
+    predictions = tree.classes_[tree.tree_.value[:, 0, :].argmax(axis=1)]
+    paths = {'train': (tree_paths(tree, Xtr), ytr), 'val': (tree_paths(tree, Xv), yv)}
+
+    depths = np.arange(1, tree.get_depth() + 1)
+    depth_df = pd.DataFrame({'max_depth': depths})
+    if truncate:
+        for split, (nodes, y) in paths.items():
+            depth_df[f'{split}_acc'] = (predictions[nodes[:, depths]] == y[:, None]).mean(axis=0)
+    else:
+        fits = [DecisionTreeClassifier(max_depth=int(d), **params).fit(Xtr, ytr) for d in depths]
+        depth_df['train_acc'] = [fit.score(Xtr, ytr) for fit in fits]
+        depth_df['val_acc'] = [fit.score(Xv, yv) for fit in fits]
+    depth_df['diff'] = depth_df.train_acc - depth_df.val_acc
+    depth_df['method'] = 'truncated' if truncate else 'refit'
+
+    node_alphas, path = prune_alphas(tree)
+    metrics = []
+    for alpha in path:
+        # every leaf of the pruned tree holds train rows, so its leaves are the train stop nodes
+        output = {'ccp_alpha': alpha,
+                  'n_leaves': len(np.unique(_truncated_nodes(paths['train'][0], node_alphas, alpha)))}
+        for split, (nodes, y) in paths.items():
+            output[f'{split}_acc'] = (predictions[_truncated_nodes(nodes, node_alphas, alpha)] == y).mean()
+        metrics.append(output)
+    alpha_df = pd.DataFrame(metrics)
+    alpha_df['diff'] = alpha_df.train_acc - alpha_df.val_acc
+    return depth_df, alpha_df
+
+### Random forests
+
+def forest_curve(Xtr, ytr, Xv=None, yv=None, step=25, max_estimators=500, tol=0.001, patience=2,
+                 n_jobs=-1, **params):
+    """
+    This function grows one random forest step trees at a time with warm_start and records the
+    out-of-bag accuracy after every step, stopping once it has improved by no more than tol over the
+    last patience steps.
+
+    :param Xtr: the train feature matrix
+    :param ytr: the train target
+    :param Xv: a validate feature matrix to score as well, defaults to None (OOB only) (optional)
+    :param yv: the validate target (optional)
+    :param step: trees added per step, defaults to 25 (optional)
+    :param max_estimators: the largest forest to grow, defaults to 500 (optional)
+    :param tol: the smallest OOB gain that still counts as improving, defaults to 0.001 (optional)
+    :param patience: steps without such a gain before stopping, defaults to 2 (optional)
+    :param n_jobs: cores to build trees on, defaults to -1 (all) (optional)
+    :param params: other RandomForestClassifier parameters, random_state defaults to 42
+    :return: the fitted forest and a DataFrame with n_estimators, oob_acc (and val_acc).
+    """
+    import warnings
+    from sklearn.ensemble import RandomForestClassifier
+    params.setdefault('random_state', 42)
+    rf = RandomForestClassifier(n_estimators=0, warm_start=True, oob_score=True, n_jobs=n_jobs,
+                                **params)
+    metrics = []
+    for n in range(step, max_estimators + step, step):
+        rf.set_params(n_estimators=min(n, max_estimators))
+        with warnings.catch_warnings():
+            # small forests leave some rows without OOB votes
+            warnings.simplefilter('ignore', UserWarning)
+            rf.fit(Xtr, ytr)
+        output = {'n_estimators': rf.n_estimators, 'oob_acc': rf.oob_score_}
+        if Xv is not None:
+            output['val_acc'] = rf.score(Xv, yv)
+        metrics.append(output)
+        oob = [m['oob_acc'] for m in metrics]
+        if len(oob) > patience and max(oob[-patience:]) - max(oob[:-patience]) <= tol:
+            break
+    return rf, pd.DataFrame(metrics)
+
+@instrument.timed
+def forest_sweep(train, target, grid=None, validate=None, features=None, **kwargs):
+    """
+    This function replaces the min_samples_leaf x max_depth random forest loop: each cell grows one
+    forest incrementally with `forest_curve` and is scored out-of-bag, so no validate split has to
+    be held out (pass train and validate together as train) and no cell trains more trees than its
+    accuracy curve needs.
+
+    :param train: the dataframe to fit on, e.g. train and validate from `prepare.split_data` combined
+    :param target: the name of the target column
+    :param grid: a parameter grid for `param_grid`, defaults to min_samples_leaf 1-20 x max_depth 1-10
+    :param validate: a validate dataframe to score as well, defaults to None (optional)
+    :param features: a list of feature columns, defaults to every numeric column except the target
+    :param kwargs: keyword arguments for `forest_curve` (step, max_estimators, tol, patience, n_jobs)
+    :return: a DataFrame with the parameters, n_estimators, train_acc, oob_acc (val_acc) and diff,
+    plus a dict of parameter tuple -> accuracy curve.
+    """
+    if grid is None:
+        grid = {'min_samples_leaf': range(1, 21), 'max_depth': range(1, 11)}
+    Xtr, ytr = xy_split(train, target, features)
+    Xv, yv = xy_split(validate, target, features) if validate is not None else (None, None)
+    metrics, curves = [], {}
+    for params in param_grid(grid):
+        rf, curve = forest_curve(Xtr, ytr, Xv, yv, **params, **kwargs)
+        curves[tuple(params.values())] = curve
+        metrics.append(dict(params, train_acc=rf.score(Xtr, ytr), **curve.iloc[-1].to_dict()))
+    df = pd.DataFrame(metrics)
+    df['n_estimators'] = df.n_estimators.astype(int)
+    df['diff'] = df.train_acc - df.oob_acc
+    return df, curves
@@ -0,0 +1,199 @@
+# imports
+import os
+import numpy as np
+import pandas as pd
+
+# lookup tables of the course databases
+IRIS_SPECIES = pd.DataFrame({'species_id': [1, 2, 3],
+                             'species_name': ['setosa', 'versicolor', 'virginica']})
+# per species mean and std of sepal_length, sepal_width, petal_length, petal_width
+IRIS_MEASUREMENTS = {
+    'setosa': ([5.01, 3.43, 1.46, 0.25], [0.35, 0.38, 0.17, 0.11]),
+    'versicolor': ([5.94, 2.77, 4.26, 1.33], [0.52, 0.31, 0.47, 0.20]),
+    'virginica': ([6.59, 2.97, 5.55, 2.03], [0.64, 0.32, 0.55, 0.27]),
+}
+CONTRACT_TYPES = pd.DataFrame({'contract_type_id': [1, 2, 3],
+                               'contract_type': ['Month-to-month', 'One year', 'Two year']})
+INTERNET_SERVICE_TYPES = pd.DataFrame({'internet_service_type_id': [1, 2, 3],
+                                       'internet_service_type': ['DSL', 'Fiber optic', 'None']})
+PAYMENT_TYPES = pd.DataFrame({'payment_type_id': [1, 2, 3, 4],
+                              'payment_type': ['Electronic check', 'Mailed check',
+                                               'Bank transfer (automatic)', 'Credit card (automatic)']})
+TELCO_ADDONS = ['online_security', 'online_backup', 'device_protection', 'tech_support',
+                'streaming_tv', 'streaming_movies']
+
+# functions
+def _choice(rng, values, n, p=None):
+    # vectorized categorical column as an object array of the given values
+    return np.array(values, dtype=object)[rng.choice(len(values), n, p=p)]
+
+def synthetic_titanic(n, seed=42, start=0):
+    """
+    This function generates rows shaped like `select * from passengers` in titanic_db: the same
+    columns, dtypes, category values and null rates (about 20% of age, 0.2% of embarked and 77% of
+    deck), with survival depending on sex and class.
+
+    :param n: the number of rows
+    :param seed: the random seed, defaults to 42 (optional)
+    :param start: the first passenger_id, to generate a large table in chunks (optional)
+    :return: a DataFrame.
+    """
+    rng = np.random.default_rng(seed)
+    pclass = rng.choice([1, 2, 3], n, p=[.24, .21, .55])
+    sex = _choice(rng, ['male', 'female'], n, p=[.65, .35])
+    age = np.clip(rng.normal(29.7, 14.5, n), 0.42, 80).round(1)
+    age[rng.random(n) < .199] = np.nan
+    sibsp = np.minimum(rng.poisson(.52, n), 8)
+    parch = np.minimum(rng.poisson(.38, n), 6)
+    fare = (rng.lognormal(2.6, 0.9, n) * np.array([0, 3.0, 1.2, 0.8])[pclass]).round(4)
+    embarked = _choice(rng, ['S', 'C', 'Q'], n, p=[.724, .189, .087])
+    embarked[rng.random(n) < .0022] = None
+    survival = np.where(sex == 'female', .74, .19) * np.array([0, 1.35, 1.1, .8])[pclass]
+    towns = {'S': 'Southampton', 'C': 'Cherbourg', 'Q': 'Queenstown', None: None}
+    deck = _choice(rng, list('ABCDEFG'), n)
+    deck[rng.random(n) < .77] = None
+    return pd.DataFrame({
+        'passenger_id': np.arange(start, start + n),
+        'survived': (rng.random(n) < np.minimum(survival, 1)).astype(np.int64),
+        'pclass': pclass,
+        'sex': sex,
+        'age': age,
+        'sibsp': sibsp,
+        'parch': parch,
+        'fare': fare,
+        'embarked': embarked,
+        'class': np.array(['', 'First', 'Second', 'Third'], dtype=object)[pclass],
+        'deck': deck,
+        'embark_town': pd.Series(embarked).map(towns).to_numpy(dtype=object),
+        'alone': ((sibsp + parch) == 0).astype(np.int64),
+    })
+
+def synthetic_iris(n, seed=42, start=0):
+    """
+    This function generates rows shaped like the iris_db species/measurements join, with balanced
+    species and per-species normal measurements close to the real data.
+
+    :param n: the number of rows
+    :param seed: the random seed, defaults to 42 (optional)
+    :param start: the first measurement_id, to generate a large table in chunks (optional)
+    :return: a DataFrame.
+    """
+    rng = np.random.default_rng(seed)
+    species = rng.integers(0, 3, n)
+    means = np.array([IRIS_MEASUREMENTS[s][0] for s in IRIS_SPECIES.species_name])
+    stds = np.array([IRIS_MEASUREMENTS[s][1] for s in IRIS_SPECIES.species_name])
+    values = np.maximum(rng.normal(means[species], stds[species]), 0.1).round(1)
+    df = pd.DataFrame({
+        'species_id': IRIS_SPECIES.species_id.to_numpy()[species],
+        'species_name': IRIS_SPECIES.species_name.to_numpy(dtype=object)[species],
+        'measurement_id': np.arange(start, start + n),
+    })
+    for i, col in enumerate(['sepal_length', 'sepal_width', 'petal_length', 'petal_width']):
+        df[col] = values[:, i]
+    return df
+
+def _telco_customers(n, rng, start):
+    yes_no = ['Yes', 'No']
+    tenure = rng.integers(0, 73, n)
+    internet = rng.choice([1, 2, 3], n, p=[.34, .44, .22])
+    phone = _choice(rng, yes_no, n, p=[.9, .1])
+    monthly = np.where(internet == 3, rng.uniform(18.25, 26, n), rng.uniform(23, 118.75, n)).round(2)
+    total = (monthly * tenure * rng.uniform(.95, 1.05, n)).round(2)
+    # total_charges is a varchar column and is blank for customers in their first month
+    total_charges = pd.Series(np.maximum(total, monthly)).astype(str).to_numpy(dtype=object)
+    total_charges[tenure == 0] = ' '
+    contract = rng.choice([1, 2, 3], n, p=[.55, .21, .24])
+    churn_rate = np.array([0, .43, .11, .03])[contract] * np.where(internet == 2, 1.4, .8)
+    df = pd.DataFrame({
+        'payment_type_id': rng.choice([1, 2, 3, 4], n, p=[.34, .23, .22, .21]),
+        'internet_service_type_id': internet,
+        'contract_type_id': contract,
+        'customer_id': pd.Series(np.arange(start, start + n)).astype(str).str.zfill(4).add('-SYNTH')
+                       .to_numpy(dtype=object),
+        'gender': _choice(rng, ['Female', 'Male'], n),
+        'senior_citizen': (rng.random(n) < .16).astype(np.int64),
+        'partner': _choice(rng, yes_no, n, p=[.48, .52]),
+        'dependents': _choice(rng, yes_no, n, p=[.3, .7]),
+        'tenure': tenure,
+        'phone_service': phone,
+        'multiple_lines': np.where(phone == 'No', 'No phone service', _choice(rng, yes_no, n))
+                          .astype(object),
+    })
+    for col in TELCO_ADDONS:
+        df[col] = np.where(internet == 3, 'No internet service', _choice(rng, yes_no, n)).astype(object)
+    df['paperless_billing'] = _choice(rng, yes_no, n, p=[.59, .41])
+    df['monthly_charges'] = monthly
+    df['total_charges'] = total_charges
+    df['churn'] = np.where(rng.random(n) < np.minimum(churn_rate, 1), 'Yes', 'No').astype(object)
+    return df
+
+def synthetic_telco(n, seed=42, start=0):
+    """
+    This function generates rows shaped like the telco_churn customers join: the same columns,
+    dtypes and category values, blank total_charges for new customers, 'No phone service' /
+    'No internet service' consistent with the services, and churn depending on contract and
+    internet service.
+
+    :param n: the number of rows
+    :param seed: the random seed, defaults to 42 (optional)
+    :param start: the first customer number, to generate a large table in chunks (optional)
+    :return: a DataFrame.
+    """
+    df = _telco_customers(n, np.random.default_rng(seed), start)
+    for lookup in (CONTRACT_TYPES, INTERNET_SERVICE_TYPES, PAYMENT_TYPES):
+        key, name = lookup.columns
+        df[name] = lookup[name].to_numpy(dtype=object)[df[key].to_numpy() - 1]
+    return df
+
+GENERATORS = {'titanic': synthetic_titanic, 'iris': synthetic_iris, 'telco': synthetic_telco}
+
+def synthetic_data(name, n, seed=42):
+    """
+    This function generates a synthetic stand-in for one of the acquire datasets.
+
+    :param name: 'titanic', 'iris' or 'telco'
+    :param n: the number of rows
+    :param seed: the random seed, defaults to 42 (optional)
+    :return: a DataFrame with the columns `acquire.get_data(name)` returns.
+    """
+    return GENERATORS[name](n, seed=seed)
+
+def write_sqlite(name, n, path, seed=42, chunk_size=1_000_000):
+    """
+    This function writes a synthetic database with the tables of the course database (e.g. species
+    and measurements for iris), generated and inserted chunk_size rows at a time so 10^7 rows never
+    sit in memory at once. Point acquire at it with
+    acquire.DB_URLS[acquire.DATASETS[name]['db']] = f'sqlite:///{path}'.
+
+    :param name: 'titanic', 'iris' or 'telco'
+    :param n: the number of rows
+    :param path: the SQLite file to (re)create
+    :param seed: the random seed, defaults to 42 (optional)
+    :param chunk_size: rows generated and inserted per chunk, defaults to 1,000,000 (optional)
+    :return: the path.
+    """
+    import sqlite3
+    if name not in GENERATORS:
+        raise ValueError(f'unknown dataset {name}, expected one of {list(GENERATORS)}')
+    if os.path.exists(path):
+        os.remove(path)
+    with sqlite3.connect(path) as conn:
+        if name == 'iris':
+            IRIS_SPECIES.to_sql('species', conn, index=False)
+        elif name == 'telco':
+            for table, lookup in [('contract_types', CONTRACT_TYPES),
+                                  ('internet_service_types', INTERNET_SERVICE_TYPES),
+                                  ('payment_types', PAYMENT_TYPES)]:
+                lookup.to_sql(table, conn, index=False)
+        for i, start in enumerate(range(0, n, chunk_size)):
+            rows = min(chunk_size, n - start)
+            if name == 'titanic':
+                synthetic_titanic(rows, seed + i, start).to_sql('passengers', conn, index=False,
+                                                                if_exists='append')
+            elif name == 'iris':
+                synthetic_iris(rows, seed + i, start).drop(columns='species_name').to_sql(
+                    'measurements', conn, index=False, if_exists='append')
+            else:
+                _telco_customers(rows, np.random.default_rng(seed + i), start).to_sql(
+                    'customers', conn, index=False, if_exists='append')
+    return path